@@ -0,0 +1,61 @@
+import time
+
+import httpx
+import requests
+
+from api_clients.sessions import async_session_pool, session_pool
+from entries.call_log import call_log
+from lib.metrics import current_view, record_outbound_call
+
+
+class BaseApiClient:
+    """
+    Every call to an integration goes through request() or arequest(), which rate limit it per user and record it
+    under the endpoint template given by the caller, in the Prometheus metrics and the integration call log.
+    """
+
+    integration = None
+
+    def __init__(self, user) -> None:
+        self.user = user
+
+    def record_call(self, method: str, endpoint: str, response, duration: float) -> None:
+        status = response.status_code if response is not None else None
+        record_outbound_call(self.integration, endpoint, method, status or "error", duration)
+
+        # requests keeps the sent body on response.request.body, httpx on response.request.content
+        body = None
+        if isinstance(response, requests.Response):
+            body = response.request.body
+        elif response is not None:
+            body = response.request.content
+
+        call_log.record(
+            user_id=self.user.pk,
+            integration=self.integration,
+            method=method,
+            endpoint=endpoint,
+            status=status,
+            duration_ms=round(duration * 1000),
+            request_bytes=len(body or b""),
+            response_bytes=len(response.content) if response is not None else 0,
+            view=current_view.get(),
+        )
+
+    def request(self, method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+        started = time.perf_counter()
+        response = None
+        try:
+            response = session_pool.request(method, url, rate_limit_key=self.user.pk, **kwargs)
+            return response
+        finally:
+            self.record_call(method, endpoint, response, time.perf_counter() - started)
+
+    async def arequest(self, method: str, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await async_session_pool.request(method, url, rate_limit_key=self.user.pk, **kwargs)
+            return response
+        finally:
+            self.record_call(method, endpoint, response, time.perf_counter() - started)
@@ -1,18 +1,54 @@
+import re
+
 import requests
 from django.conf import settings
 from django.utils import timezone
 from requests.auth import HTTPBasicAuth
 
-from lib.utils import FernetCipher
+from api_clients.base import BaseApiClient
+from api_clients.sessions import SessionPool
+from lib.cache import TTLCache
+from lib.utils import get_decrypted_credential, get_payload_hash
+
+# Maximum number of IDs accepted by POST /rest/api/3/worklog/list
+WORKLOG_LIST_BATCH_SIZE = 1000
+
+# Maximum page size of the issue search endpoint, also the number of ids or keys put into one JQL clause
+ISSUE_SEARCH_BATCH_SIZE = 100
+
+# Issue suggestions returned per search term
+ISSUE_SUGGESTION_LIMIT = 20
+
+# Default Jira issue key format. Keys are only put into JQL after matching it
+ISSUE_KEY_PATTERN = re.compile(r"^[A-Z][A-Z0-9_]*-[0-9]+$")
+
+# Characters with a meaning in JQL text searches, dropped from search terms
+JQL_TEXT_SPECIAL_CHARACTERS = re.compile(r'[+\-&|!(){}\[\]^~*?/\\:"\']')
 
+# Issues keyed by (host, issue key), shared by every user of a Jira site
+issue_cache = TTLCache(maxsize=settings.JIRA_ISSUE_CACHE_SIZE, ttl=settings.JIRA_ISSUE_CACHE_TTL)
+# Suggestions keyed by (host, user, search term), search results depend on what the user may see
+issue_search_cache = TTLCache(maxsize=settings.JIRA_ISSUE_SEARCH_CACHE_SIZE, ttl=settings.JIRA_ISSUE_SEARCH_CACHE_TTL)
 
-class JiraApiClient:
+
+class JiraApiClient(BaseApiClient):
+    integration = "jira"
+    # Path templates the calls are logged under, see entries.call_log
+    endpoints = (
+        "/rest/api/3/issue/{key}/worklog",
+        "/rest/api/3/issue/{key}/worklog/{id}",
+        "/rest/api/3/myself",
+        "/rest/api/3/search/jql",
+        "/rest/api/3/worklog/list",
+        "/rest/api/3/worklog/updated",
+    )
 
     def __init__(self, user):
+        super().__init__(user)
         self.base_url = user.jira_url
 
         # Decrypt API key
-        api_key = FernetCipher().decrypt_value(user.jira_api_key)
+        api_key = get_decrypted_credential(user.pk, user.jira_api_key)
         self.auth = HTTPBasicAuth(username=user.jira_email_address, password=api_key)
 
         self.headers = {
@@ -20,47 +56,14 @@ class JiraApiClient:
           "Content-Type": "application/json"
         }
 
-    def create_entry(self, jira_entry):
-        url = f"{self.base_url}/rest/api/3/issue/{jira_entry.jira_issue_number}/worklog"
-        payload = {
-          "comment": {
-            "content": [
-              {
-                "content": [
-                  {
-                    "text": jira_entry.description,
-                    "type": "text"
-                  }
-                ],
-                "type": "paragraph"
-              }
-            ],
-            "type": "doc",
-            "version": 1
-          },
-          "started": timezone.now().replace(
-                year=jira_entry.entry.date_created.year,
-                month=jira_entry.entry.date_created.month,
-                day=jira_entry.entry.date_created.day,
-            ).strftime("%Y-%m-%dT%H:%M:%S.000%z"),
-          "timeSpentSeconds": jira_entry.minutes_spent * 60,  # Convert to seconds
-        }
+    @property
+    def async_auth(self) -> tuple:
+        # httpx takes basic auth as a (username, password) tuple
+        return self.auth.username, self.auth.password
 
-        response = requests.post(
-            url,
-            json=payload,
-            headers=self.headers,
-            auth=self.auth
-        )
-
-        if response.ok:
-            jira_entry.jira_entry_id = response.json().get('id')
-            jira_entry.last_synced_at = timezone.now()
-            jira_entry.save()
-
-    def update_entry(self, jira_entry):
-        url = f"{self.base_url}/rest/api/3/issue/{jira_entry.jira_issue_number}/worklog/{jira_entry.jira_entry_id}"
-        payload = {
+    @staticmethod
+    def get_worklog_payload(jira_entry) -> dict:
+        return {
             "comment": {
                 "content": [
                     {
@@ -84,18 +87,338 @@ class JiraApiClient:
             "timeSpentSeconds": jira_entry.minutes_spent * 60,  # Convert to seconds
         }
 
-        response = requests.put(
-            url,
+    @staticmethod
+    def get_worklog_hash(payload: dict) -> str:
+        # The time of day in "started" comes from the clock on every call, only its date identifies the worklog
+        return get_payload_hash({**payload, "started": payload["started"][:10]})
+
+    def get_worklog_url(self, jira_entry) -> str:
+        url = f"{self.base_url}/rest/api/3/issue/{jira_entry.jira_issue_number}/worklog"
+        if jira_entry.jira_entry_id:
+            url = f"{url}/{jira_entry.jira_entry_id}"
+        return url
+
+    @staticmethod
+    def get_comment_text(comment) -> str:
+        # Flatten an Atlassian Document Format comment back into plain text
+        if not comment:
+            return ""
+
+        if isinstance(comment, str):
+            return comment
+
+        paragraphs = []
+        for block in comment.get("content", []):
+            paragraphs.append("".join(node.get("text", "") for node in block.get("content", [])))
+        return "\n".join(paragraphs)
+
+    def get_worklogs(self, worklog_ids: list) -> list:
+        """
+        Fetch worklogs by ID in batches of up to 1000 (the limit of Jira's worklog list endpoint). Worklogs that no
+        longer exist are simply missing from the result.
+        """
+        worklogs = []
+        url = f"{self.base_url}/rest/api/3/worklog/list"
+
+        for i in range(0, len(worklog_ids), WORKLOG_LIST_BATCH_SIZE):
+            batch = [int(worklog_id) for worklog_id in worklog_ids[i:i + WORKLOG_LIST_BATCH_SIZE]]
+            response = self.request(
+                "POST",
+                url,
+                json={"ids": batch},
+                headers=self.headers,
+                auth=self.auth,
+                endpoint="/rest/api/3/worklog/list"
+            )
+
+            response.raise_for_status()
+            worklogs.extend(response.json())
+
+        return worklogs
+
+    def get_myself(self) -> dict:
+        response = self.request(
+            "GET",
+            f"{self.base_url}/rest/api/3/myself",
+            headers=self.headers,
+            auth=self.auth,
+            endpoint="/rest/api/3/myself"
+        )
+
+        response.raise_for_status()
+        return response.json()
+
+    def get_updated_worklog_ids(self, since: int) -> tuple:
+        """
+        Walk the worklog updated feed from `since` (epoch milliseconds). Returns the changed worklog IDs and the
+        `until` timestamp to use as the next high-water mark.
+        """
+        worklog_ids = []
+        url = f"{self.base_url}/rest/api/3/worklog/updated?since={since}"
+        until = since
+
+        while url:
+            response = self.request("GET", url, headers=self.headers, auth=self.auth,
+                                    endpoint="/rest/api/3/worklog/updated")
+            response.raise_for_status()
+
+            data = response.json()
+            worklog_ids.extend(value["worklogId"] for value in data.get("values", []))
+            until = data.get("until", until)
+            url = None if data.get("lastPage", True) else data.get("nextPage")
+
+        return worklog_ids, until
+
+    def search(self, jql: str, fields: list, limit: int = None) -> list:
+        """
+        Run a JQL search, following nextPageToken until every matching issue (or the first `limit`) is fetched.
+        """
+        issues = []
+        next_page_token = None
+
+        while True:
+            page_size = min(limit - len(issues), ISSUE_SEARCH_BATCH_SIZE) if limit else ISSUE_SEARCH_BATCH_SIZE
+            payload = {"jql": jql, "fields": fields, "maxResults": page_size}
+            if next_page_token:
+                payload["nextPageToken"] = next_page_token
+
+            response = self.request(
+                "POST",
+                f"{self.base_url}/rest/api/3/search/jql",
+                json=payload,
+                headers=self.headers,
+                auth=self.auth,
+                endpoint="/rest/api/3/search/jql"
+            )
+
+            response.raise_for_status()
+            data = response.json()
+            issues.extend(data.get("issues", []))
+
+            next_page_token = data.get("nextPageToken")
+            if data.get("isLast", True) or not next_page_token or (limit and len(issues) >= limit):
+                return issues[:limit] if limit else issues
+
+    def search_in(self, field: str, values: list, fields: list) -> list:
+        """
+        Issues whose `field` (id or key) is one of `values`, with one search per 100 values. Jira fails a search
+        naming an issue that doesn't exist, so values it reports as unknown are dropped and the search repeated.
+        """
+        issues = []
+
+        for i in range(0, len(values), ISSUE_SEARCH_BATCH_SIZE):
+            batch = [str(value) for value in values[i:i + ISSUE_SEARCH_BATCH_SIZE]]
+
+            while batch:
+                clause = ", ".join(value if value.isdigit() else f'"{value}"' for value in batch)
+                try:
+                    issues.extend(self.search(f"{field} in ({clause})", fields))
+                    break
+                except requests.HTTPError as e:
+                    unknown = self.get_unknown_values(e.response, batch)
+                    if not unknown:
+                        raise
+                    batch = [value for value in batch if value not in unknown]
+
+        return issues
+
+    @staticmethod
+    def get_unknown_values(response, values: list) -> set:
+        # e.g. "An issue with key 'ABC-123' does not exist for field 'key'."
+        if response is None or response.status_code != 400:
+            return set()
+
+        try:
+            error_messages = response.json().get("errorMessages", [])
+        except ValueError:
+            return set()
+
+        quoted = {value for message in error_messages for value in re.findall(r"'([^']+)'", message)}
+        return quoted & set(values)
+
+    def get_issue_keys(self, issue_ids: list) -> dict:
+        # Worklogs only reference the issue ID, look up the keys with one search per 100 issues
+        return {str(issue["id"]): issue["key"] for issue in self.search_in("id", issue_ids, fields=["key"])}
+
+    @property
+    def host(self) -> str:
+        return SessionPool.get_host_key(self.base_url)
+
+    @staticmethod
+    def clear_cache(user) -> None:
+        host = SessionPool.get_host_key(user.jira_url or "")
+        issue_cache.discard_where(lambda key: key[0] == host)
+        issue_search_cache.discard_where(lambda key: key[0] == host and key[1] == user.pk)
+
+    @staticmethod
+    def normalize_issue_key(issue_key: str) -> str:
+        return issue_key.strip().upper()
+
+    def search_issues(self, jql: str, max_results: int) -> list:
+        """
+        Run a JQL search for up to max_results issues and cache every issue found.
+        """
+        return self.cache_issues(self.search(jql, fields=["summary"], limit=max_results))
+
+    def cache_issues(self, found: list) -> list:
+        issues = [{"key": issue["key"], "summary": issue.get("fields", {}).get("summary", "")} for issue in found]
+        for issue in issues:
+            issue_cache.set((self.host, issue["key"]), issue)
+
+        return issues
+
+    def get_issues(self, issue_keys) -> dict:
+        """
+        Look up issues by key, from the cache where possible and otherwise with one `key in (...)` search per 100
+        keys. Returns the issues found keyed by their key, keys that don't exist or aren't visible to the user are
+        left out.
+        """
+        issues, missing = {}, []
+        for issue_key in {self.normalize_issue_key(issue_key) for issue_key in issue_keys}:
+            issue = issue_cache.get((self.host, issue_key))
+            if issue is not None:
+                issues[issue_key] = issue
+            elif ISSUE_KEY_PATTERN.match(issue_key):
+                missing.append(issue_key)
+
+        for issue in self.cache_issues(self.search_in("key", sorted(missing), fields=["summary"])):
+            issues[issue["key"]] = issue
+
+        return issues
+
+    def suggest_issues(self, term: str) -> list:
+        """
+        Issues whose key is the term or whose summary has a word starting with it, most recently updated first.
+        """
+        cache_key = (self.host, self.user.pk, term.strip().lower())
+        suggestions = issue_search_cache.get(cache_key)
+        if suggestions is not None:
+            return suggestions
+
+        issue_key = self.normalize_issue_key(term)
+        if not ISSUE_KEY_PATTERN.match(issue_key):
+            issue_key = None
+
+        clauses = [f'key = "{issue_key}"'] if issue_key else []
+        text = " ".join(JQL_TEXT_SPECIAL_CHARACTERS.sub(" ", term).split())
+        if text:
+            clauses.append(f'summary ~ "{text}*"')
+
+        suggestions = []
+        while clauses:
+            try:
+                suggestions = self.search_issues(
+                    f"{' OR '.join(clauses)} ORDER BY updated DESC", max_results=ISSUE_SUGGESTION_LIMIT
+                )
+                break
+            except requests.HTTPError as e:
+                # Jira fails the whole search when the key doesn't exist, search the summaries alone
+                if not issue_key or not self.get_unknown_values(e.response, [issue_key]):
+                    raise
+                clauses, issue_key = clauses[1:], None
+
+        issue_search_cache.set(cache_key, suggestions)
+        return suggestions
+
+    def create_entry(self, jira_entry, save=True):
+        payload = self.get_worklog_payload(jira_entry)
+        response = self.request(
+            "POST",
+            self.get_worklog_url(jira_entry),
             json=payload,
             headers=self.headers,
-            auth=self.auth
+            auth=self.auth,
+            endpoint="/rest/api/3/issue/{key}/worklog"
         )
 
-        if response.ok:
-            jira_entry.last_synced_at = timezone.now()
-            jira_entry.save()
+        response.raise_for_status()
+
+        jira_entry.jira_entry_id = response.json().get('id')
+        jira_entry.payload_hash = self.get_worklog_hash(payload)
+        jira_entry.last_synced_at = timezone.now()
+        if save:
+            jira_entry.save(update_fields=['jira_entry_id', 'last_synced_at', 'payload_hash'])
+
+    def update_entry(self, jira_entry, save=True):
+        payload = self.get_worklog_payload(jira_entry)
+        payload_hash = self.get_worklog_hash(payload)
+
+        # Jira already has exactly this worklog
+        if payload_hash == jira_entry.payload_hash and jira_entry.last_synced_at:
+            return
+
+        response = self.request(
+            "PUT",
+            self.get_worklog_url(jira_entry),
+            json=payload,
+            headers=self.headers,
+            auth=self.auth,
+            endpoint="/rest/api/3/issue/{key}/worklog/{id}"
+        )
+
+        response.raise_for_status()
+
+        jira_entry.payload_hash = payload_hash
+        jira_entry.last_synced_at = timezone.now()
+        if save:
+            jira_entry.save(update_fields=['last_synced_at', 'payload_hash'])
 
     def delete_entry(self, jira_entry):
-        url = f"{self.base_url}/rest/api/3/issue/{jira_entry.jira_issue_number}/worklog/{jira_entry.jira_entry_id}"
-        response = requests.delete(url=url, auth=self.auth)
+        response = self.request("DELETE", self.get_worklog_url(jira_entry), auth=self.auth,
+                                endpoint="/rest/api/3/issue/{key}/worklog/{id}")
+
+        # A worklog that no longer exists doesn't need deleting
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    # Async variants for use under ASGI. The entry's `entry__user` must already be loaded (select_related), since
+    # lazy relation lookups aren't allowed in an async context.
+
+    async def acreate_entry(self, jira_entry):
+        payload = self.get_worklog_payload(jira_entry)
+        response = await self.arequest(
+            "POST",
+            self.get_worklog_url(jira_entry),
+            json=payload,
+            headers=self.headers,
+            auth=self.async_auth,
+            endpoint="/rest/api/3/issue/{key}/worklog"
+        )
+
+        response.raise_for_status()
+
+        jira_entry.jira_entry_id = response.json().get('id')
+        jira_entry.payload_hash = self.get_worklog_hash(payload)
+        jira_entry.last_synced_at = timezone.now()
+        await jira_entry.asave(update_fields=['jira_entry_id', 'last_synced_at', 'payload_hash'])
+
+    async def aupdate_entry(self, jira_entry):
+        payload = self.get_worklog_payload(jira_entry)
+        payload_hash = self.get_worklog_hash(payload)
+
+        # Jira already has exactly this worklog
+        if payload_hash == jira_entry.payload_hash and jira_entry.last_synced_at:
+            return
+
+        response = await self.arequest(
+            "PUT",
+            self.get_worklog_url(jira_entry),
+            json=payload,
+            headers=self.headers,
+            auth=self.async_auth,
+            endpoint="/rest/api/3/issue/{key}/worklog/{id}"
+        )
+
+        response.raise_for_status()
+
+        jira_entry.payload_hash = payload_hash
+        jira_entry.last_synced_at = timezone.now()
+        await jira_entry.asave(update_fields=['last_synced_at', 'payload_hash'])
+
+    async def adelete_entry(self, jira_entry):
+        response = await self.arequest("DELETE", self.get_worklog_url(jira_entry), auth=self.async_auth,
+                                       endpoint="/rest/api/3/issue/{key}/worklog/{id}")
 
+        # A worklog that no longer exists doesn't need deleting
+        if response.status_code != 404:
+            response.raise_for_status()
@@ -0,0 +1,152 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class RateLimited(Exception):
+    """
+    Raised when a call would have to wait longer than the limiter's max_wait for a token.
+    """
+
+    def __init__(self, key, wait: float) -> None:
+        super().__init__(f"Rate limited on {key}, retry in {wait:.1f}s")
+        self.key = key
+        self.wait = wait
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class RateLimiter:
+    """
+    Thread-safe token buckets keyed by (integration host, user).
+
+    reserve() takes a token straight away and returns how long the caller has to wait before using it, so the same
+    limiter works for blocking and asyncio callers. Server feedback (Retry-After and X-RateLimit-* headers) blocks or
+    re-sizes the bucket for everyone sharing the key.
+    """
+
+    def __init__(self, rate: float, burst: float, max_wait: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, key) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate=self.rate, capacity=self.burst)
+        return bucket
+
+    def reserve(self, key) -> float:
+        with self._lock:
+            now = time.monotonic()
+            bucket = self.get_bucket(key)
+            bucket.refill(now)
+
+            wait = max(bucket.blocked_until - now, 0.0)
+            if bucket.tokens < 1:
+                wait = max(wait, (1 - bucket.tokens) / bucket.rate)
+
+            if wait > self.max_wait:
+                raise RateLimited(key, wait)
+
+            # Tokens can go negative, later callers queue up behind this one
+            bucket.tokens -= 1
+            return wait
+
+    def acquire(self, key) -> None:
+        wait = self.reserve(key)
+        if wait:
+            time.sleep(wait)
+
+    def update_from_headers(self, key, status_code: int, headers) -> float:
+        """
+        Apply the server's rate limit feedback. Returns how long the server asked us to back off for.
+        """
+        backoff = 0.0
+
+        retry_after = self.parse_retry_after(headers.get("Retry-After"))
+        if retry_after is not None and status_code in (429, 503):
+            backoff = retry_after
+
+        # Out of quota until the reset time
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is not None and remaining.strip() == "0":
+            backoff = max(backoff, self.parse_reset(headers.get("X-RateLimit-Reset")) or 0.0)
+
+        if status_code == 429 and not backoff:
+            # Throttled without a hint, give the bucket a moment to refill
+            backoff = 1 / self.rate
+
+        with self._lock:
+            bucket = self.get_bucket(key)
+
+            # Match the bucket size to the advertised limit, e.g. Jira's X-RateLimit-Limit/FillRate/Interval-Seconds
+            limit = self.parse_float(headers.get("X-RateLimit-Limit"))
+            interval = self.parse_float(headers.get("X-RateLimit-Interval-Seconds"))
+            fill_rate = self.parse_float(headers.get("X-RateLimit-FillRate"))
+            if limit and interval:
+                bucket.capacity = limit
+                bucket.rate = (fill_rate or limit) / interval
+
+            if backoff:
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + backoff)
+                bucket.tokens = min(bucket.tokens, 0)
+
+        return backoff
+
+    @staticmethod
+    def parse_float(value) -> float or None:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def parse_retry_after(cls, value) -> float or None:
+        # Either a number of seconds or an HTTP date
+        if not value:
+            return None
+
+        seconds = cls.parse_float(value)
+        if seconds is not None:
+            return max(seconds, 0.0)
+
+        try:
+            return max((parsedate_to_datetime(value) - timezone.now()).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def parse_reset(cls, value) -> float or None:
+        # Either an epoch timestamp or an ISO 8601 date time (Jira Cloud)
+        if not value:
+            return None
+
+        epoch = cls.parse_float(value)
+        if epoch is not None:
+            return max(epoch - time.time(), 0.0)
+
+        reset_at = parse_datetime(value)
+        if reset_at is None:
+            return None
+
+        if timezone.is_naive(reset_at):
+            reset_at = timezone.make_aware(reset_at, timezone.utc)
+
+        return max((reset_at - timezone.now()).total_seconds(), 0.0)
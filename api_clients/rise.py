@@ -1,21 +1,32 @@
-import json
-
-import requests
 from django.conf import settings
 from django.utils import timezone
 
 from entries.models import RiseEntry
-from lib.utils import FernetCipher, format_date
+from api_clients.base import BaseApiClient
+from lib.cache import TTLCache
+from lib.utils import format_date, get_decrypted_credential, get_payload_hash
 from users.models import User
 
+# Dashboard responses keyed by (user, from_date, to_date), and the assignments in them keyed by (user, assignment id)
+dashboard_cache = TTLCache(maxsize=settings.RISE_DASHBOARD_CACHE_SIZE, ttl=settings.RISE_DASHBOARD_CACHE_TTL)
+assignment_cache = TTLCache(maxsize=settings.RISE_DASHBOARD_CACHE_SIZE * 20, ttl=settings.RISE_DASHBOARD_CACHE_TTL)
+
 
-class RiseApiClient:
+class RiseApiClient(BaseApiClient):
+    integration = "rise"
+    # Path templates the calls are logged under, see entries.call_log
+    endpoints = (
+        "/employees/dashboards/me/",
+        "/employees/{id}/actions/log/",
+        "/timesheets/{id}/actions/delete/",
+        "/timesheets/{id}/actions/edit_log/",
+    )
 
     def __init__(self, user: User) -> None:
-        self.user = user
+        super().__init__(user)
 
         # Set auth by decrypting api key
-        api_key = FernetCipher().decrypt_value(self.user.rise_api_key)
+        api_key = get_decrypted_credential(self.user.pk, self.user.rise_api_key)
         self.headers = {
             "Authorization": f"Token {api_key}",
         }
@@ -24,47 +35,79 @@ class RiseApiClient:
         self.start_date = timezone.now().date()
         self.end_date = timezone.now().date() + timezone.timedelta(days=7)
 
-    def get_assignments(self) -> list or None:
-        url = f"{self.base_url}/employees/dashboards/me/?from_date={self.start_date}&to_date={self.end_date}"
-        response = requests.get(url, headers=self.headers)
+    def get_dashboard(self, start_date: timezone.datetime.date, end_date: timezone.datetime.date) -> dict or None:
+        """
+        Fetch the user's dashboard for a date window, served from the per-user cache when possible.
+        """
+        cache_key = (self.user.pk, str(start_date), str(end_date))
+        dashboard = dashboard_cache.get(cache_key)
+        if dashboard is not None:
+            return dashboard
+
+        response = self.request("GET", self.get_dashboard_url(start_date, end_date), headers=self.headers, endpoint="/employees/dashboards/me/")
+
+        if not response.ok:
+            return None
+
+        return self.cache_dashboard(cache_key, response.json())
+
+    def get_dashboard_url(self, start_date: timezone.datetime.date, end_date: timezone.datetime.date) -> str:
+        return f"{self.base_url}/employees/dashboards/me/?from_date={start_date}&to_date={end_date}"
+
+    def cache_dashboard(self, cache_key: tuple, data: dict) -> dict:
+        tables = data.get("tables", {})
+        assignments = tables.get("assignments", [])
+        global_projects = tables.get("global_projects", [])
 
         choices = [("", "Select A Project")]
-        if response.ok:
-            for assignment in response.json().get("tables", {}).get("assignments", []):
-                choices.append(
-                    (assignment["id"], f'{assignment["milestone"]["project"]["name"]} ({format_date(assignment["milestone"]["start_date"])} -  {format_date(assignment["milestone"]["end_date"])})')
-                )
+        for assignment in assignments:
+            choices.append(
+                (assignment["id"], f'{assignment["milestone"]["project"]["name"]} ({format_date(assignment["milestone"]["start_date"])} -  {format_date(assignment["milestone"]["end_date"])})')
+            )
 
-            for project in response.json().get("tables", {}).get("global_projects", []):
-                choices.append(
-                    (project['id'], f'{project["name"]} ({format_date(project["start_date"])} -  {format_date(project["end_date"])})')
-                )
+        for project in global_projects:
+            choices.append(
+                (project['id'], f'{project["name"]} ({format_date(project["start_date"])} -  {format_date(project["end_date"])})')
+            )
 
-            return choices
+        # Index by ID, assignments take precedence over global projects with the same ID
+        by_id = {str(project["id"]): project for project in global_projects}
+        by_id.update({str(assignment["id"]): assignment for assignment in assignments})
+
+        dashboard = {"choices": choices, "by_id": by_id}
+        dashboard_cache.set(cache_key, dashboard)
+
+        # Assignment details don't depend on the window they were fetched with
+        for assignment_id, assignment in by_id.items():
+            assignment_cache.set((self.user.pk, assignment_id), assignment)
+
+        return dashboard
+
+    def get_assignments(self) -> list or None:
+        dashboard = self.get_dashboard(start_date=self.start_date, end_date=self.end_date)
+        if dashboard:
+            return list(dashboard["choices"])
 
         return None
 
     def get_single_assignment(self, assignment_id: int, start_date: timezone.datetime.date) -> dict:
-        start_date = start_date or self.start_date
-        url = f"{self.base_url}/employees/dashboards/me/?from_date={start_date}&to_date={self.end_date}"
-        response = requests.get(url, headers=self.headers)
-        user_assignment = None
+        user_assignment = assignment_cache.get((self.user.pk, str(assignment_id)))
+        if user_assignment is not None:
+            return user_assignment
 
-        for assignment in response.json().get("tables", {}).get("assignments", []):
-            if str(assignment["id"]) == str(assignment_id):
-                user_assignment = assignment
+        dashboard = self.get_dashboard(start_date=start_date or self.start_date, end_date=self.end_date)
+        if dashboard:
+            return dashboard["by_id"].get(str(assignment_id))
 
-        if not user_assignment:
-            # Check global projects
-            for project in response.json().get("tables", {}).get("global_projects", []):
-                if str(project["id"]) == str(assignment_id):
-                    user_assignment = project
+        return None
 
-        return user_assignment
+    @staticmethod
+    def clear_cache(user: User) -> None:
+        dashboard_cache.discard_where(lambda key: key[0] == user.pk)
+        assignment_cache.discard_where(lambda key: key[0] == user.pk)
 
-    def create_entry(self, rise_entry: RiseEntry) -> None:
-        # Define base request info
-        url = f"{self.base_url}/employees/{rise_entry.entry.user.rise_user_id}/actions/log/"
+    @staticmethod
+    def get_create_payload(rise_entry: RiseEntry) -> dict:
         data = {
             "day": rise_entry.entry.date_created.isoformat(),
             "hours": str(rise_entry.hours_worked),
@@ -76,31 +119,126 @@ class RiseApiClient:
         else:
             data["project"] = rise_entry.rise_assignment_id
 
+        return data
+
+    @staticmethod
+    def get_update_payload(rise_entry: RiseEntry) -> dict:
+        return {
+            "hours_recorded": str(rise_entry.hours_worked),
+            "description": rise_entry.value
+        }
+
+    def create_entry(self, rise_entry: RiseEntry, save: bool = True) -> None:
+        # Define base request info
+        url = f"{self.base_url}/employees/{rise_entry.entry.user.rise_user_id}/actions/log/"
+
         # Make the request
-        result = requests.post(url, headers=self.headers, json=data)
+        result = self.request("POST", url, headers=self.headers, endpoint="/employees/{id}/actions/log/", json=self.get_create_payload(rise_entry))
 
-        # Update local entry
-        if result.ok:
-            rise_entry.rise_entry_id = result.json()["id"]
-            rise_entry.last_synced_at = timezone.now()
-            rise_entry.save()
+        result.raise_for_status()
 
-    def update_entry(self, rise_entry: RiseEntry) -> None:
+        # Update local entry. Updates only send hours and description, so fingerprint those
+        rise_entry.rise_entry_id = result.json()["id"]
+        rise_entry.payload_hash = get_payload_hash(self.get_update_payload(rise_entry))
+        rise_entry.last_synced_at = timezone.now()
+        if save:
+            rise_entry.save(update_fields=['rise_entry_id', 'last_synced_at', 'payload_hash'])
+
+    def update_entry(self, rise_entry: RiseEntry, save: bool = True) -> None:
         # Define base request info
         url = f"{self.base_url}/timesheets/{rise_entry.rise_entry_id}/actions/edit_log/"
-        data = {
-            "hours_recorded": str(rise_entry.hours_worked),
-            "description": rise_entry.value
-        }
+        payload = self.get_update_payload(rise_entry)
+        payload_hash = get_payload_hash(payload)
+
+        # Rise already has exactly this timesheet
+        if payload_hash == rise_entry.payload_hash and rise_entry.last_synced_at:
+            return
 
         # Make the request
-        result = requests.post(url, headers=self.headers, json=data)
+        result = self.request("POST", url, headers=self.headers, endpoint="/timesheets/{id}/actions/edit_log/", json=payload)
+
+        result.raise_for_status()
 
         # Update local rise entry
-        if result.ok:
-            rise_entry.last_synced_at = timezone.now()
-            rise_entry.save()
+        rise_entry.payload_hash = payload_hash
+        rise_entry.last_synced_at = timezone.now()
+        if save:
+            rise_entry.save(update_fields=['last_synced_at', 'payload_hash'])
 
     def delete_entry(self, rise_entry: RiseEntry) -> None:
         url = f"{self.base_url}/timesheets/{rise_entry.rise_entry_id}/actions/delete/"
-        requests.post(url, headers=self.headers, json={})
+        result = self.request("POST", url, headers=self.headers, endpoint="/timesheets/{id}/actions/delete/", json={})
+
+        # A timesheet that no longer exists doesn't need deleting
+        if result.status_code != 404:
+            result.raise_for_status()
+
+    # Async variants for use under ASGI. The entry's `entry__user` must already be loaded (select_related), since
+    # lazy relation lookups aren't allowed in an async context.
+
+    async def aget_dashboard(self, start_date: timezone.datetime.date, end_date: timezone.datetime.date) -> dict or None:
+        cache_key = (self.user.pk, str(start_date), str(end_date))
+        dashboard = dashboard_cache.get(cache_key)
+        if dashboard is not None:
+            return dashboard
+
+        url = self.get_dashboard_url(start_date, end_date)
+        response = await self.arequest("GET", url, headers=self.headers, endpoint="/employees/dashboards/me/")
+
+        if not response.is_success:
+            return None
+
+        return self.cache_dashboard(cache_key, response.json())
+
+    async def aget_assignments(self) -> list or None:
+        dashboard = await self.aget_dashboard(start_date=self.start_date, end_date=self.end_date)
+        if dashboard:
+            return list(dashboard["choices"])
+
+        return None
+
+    async def aget_single_assignment(self, assignment_id: int, start_date: timezone.datetime.date) -> dict:
+        user_assignment = assignment_cache.get((self.user.pk, str(assignment_id)))
+        if user_assignment is not None:
+            return user_assignment
+
+        dashboard = await self.aget_dashboard(start_date=start_date or self.start_date, end_date=self.end_date)
+        if dashboard:
+            return dashboard["by_id"].get(str(assignment_id))
+
+        return None
+
+    async def acreate_entry(self, rise_entry: RiseEntry) -> None:
+        url = f"{self.base_url}/employees/{rise_entry.entry.user.rise_user_id}/actions/log/"
+        result = await self.arequest("POST", url, headers=self.headers, endpoint="/employees/{id}/actions/log/", json=self.get_create_payload(rise_entry))
+
+        result.raise_for_status()
+
+        rise_entry.rise_entry_id = result.json()["id"]
+        rise_entry.payload_hash = get_payload_hash(self.get_update_payload(rise_entry))
+        rise_entry.last_synced_at = timezone.now()
+        await rise_entry.asave(update_fields=['rise_entry_id', 'last_synced_at', 'payload_hash'])
+
+    async def aupdate_entry(self, rise_entry: RiseEntry) -> None:
+        url = f"{self.base_url}/timesheets/{rise_entry.rise_entry_id}/actions/edit_log/"
+        payload = self.get_update_payload(rise_entry)
+        payload_hash = get_payload_hash(payload)
+
+        if payload_hash == rise_entry.payload_hash and rise_entry.last_synced_at:
+            return
+
+        result = await self.arequest("POST", url, headers=self.headers, endpoint="/timesheets/{id}/actions/edit_log/", json=payload)
+
+        result.raise_for_status()
+
+        rise_entry.payload_hash = payload_hash
+        rise_entry.last_synced_at = timezone.now()
+        await rise_entry.asave(update_fields=['last_synced_at', 'payload_hash'])
+
+    async def adelete_entry(self, rise_entry: RiseEntry) -> None:
+        url = f"{self.base_url}/timesheets/{rise_entry.rise_entry_id}/actions/delete/"
+        result = await self.arequest("POST", url, headers=self.headers, endpoint="/timesheets/{id}/actions/delete/", json={})
+
+        # A timesheet that no longer exists doesn't need deleting
+        if result.status_code != 404:
+            result.raise_for_status()
@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api_clients.ratelimit import RateLimiter
+
+
+class SessionPool:
+    """
+    Process-wide pool of keep-alive sessions, one per integration host.
+
+    Users can point at different Jira instances, so sessions are keyed by scheme and host and shared between all
+    clients talking to that host. Every request gets a (connect, read) timeout unless one is passed explicitly.
+
+    Requests made with a rate_limit_key (usually the user's id) go through the rate limiter for (host, key), and
+    throttled (429) responses are retried once the server's Retry-After has passed.
+    """
+
+    def __init__(self, pool_maxsize: int, connect_timeout: float, read_timeout: float, rate_limiter: RateLimiter,
+                 rate_limit_retries: int = 3, connect_retries: int = 2) -> None:
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.rate_limit_retries = rate_limit_retries
+        self.connect_retries = connect_retries
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_host_key(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def build_session(self) -> requests.Session:
+        # Only retry failed connects, a retried POST could create a duplicate worklog
+        # Throttling (429/503 + Retry-After) is handled by the rate limiter, not urllib3
+        retry = Retry(total=self.connect_retries, connect=self.connect_retries, read=0, status=0, redirect=0,
+                      respect_retry_after_header=False, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry, pool_block=True)
+
+        session = requests.Session()
+
+        # Sessions are shared between users on the same host, so never keep cookies between requests
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get_session(self, url: str) -> requests.Session:
+        host_key = self.get_host_key(url)
+        session = self._sessions.get(host_key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host_key)
+                if session is None:
+                    session = self._sessions[host_key] = self.build_session()
+
+        return session
+
+    def request(self, method: str, url: str, rate_limit_key=None, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.get_session(url)
+
+        if rate_limit_key is None:
+            return session.request(method, url, **kwargs)
+
+        key = (self.get_host_key(url), rate_limit_key)
+        for attempt in range(self.rate_limit_retries + 1):
+            self.rate_limiter.acquire(key)
+            response = session.request(method, url, **kwargs)
+
+            if not self.rate_limiter.update_from_headers(key, response.status_code, response.headers) \
+                    or response.status_code not in (429, 503):
+                break
+
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class AsyncSessionPool:
+    """
+    Async counterpart of SessionPool, holding one httpx.AsyncClient per host for each running event loop.
+    """
+
+    def __init__(self, pool_maxsize: int, connect_timeout: float, read_timeout: float, rate_limiter: RateLimiter,
+                 rate_limit_retries: int = 3) -> None:
+        self.rate_limiter = rate_limiter
+        self.rate_limit_retries = rate_limit_retries
+        self.limits = httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+
+        # AsyncClients can't be shared between event loops, so clients are kept per loop
+        self._clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def build_client(self) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+
+        # Clients are shared between users on the same host, so never keep cookies between requests
+        client.cookies = httpx.Cookies(CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])))
+        return client
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        host_key = SessionPool.get_host_key(url)
+
+        with self._lock:
+            loop_clients = self._clients.setdefault(loop, {})
+            if host_key not in loop_clients:
+                loop_clients[host_key] = self.build_client()
+            return loop_clients[host_key]
+
+    async def request(self, method: str, url: str, rate_limit_key=None, **kwargs) -> httpx.Response:
+        client = self.get_client(url)
+
+        if rate_limit_key is None:
+            return await client.request(method, url, **kwargs)
+
+        key = (SessionPool.get_host_key(url), rate_limit_key)
+        for attempt in range(self.rate_limit_retries + 1):
+            wait = self.rate_limiter.reserve(key)
+            if wait:
+                await asyncio.sleep(wait)
+
+            response = await client.request(method, url, **kwargs)
+
+            if not self.rate_limiter.update_from_headers(key, response.status_code, response.headers) \
+                    or response.status_code not in (429, 503):
+                break
+
+        return response
+
+    async def aclose(self) -> None:
+        # Close the clients belonging to the current event loop
+        with self._lock:
+            loop_clients = self._clients.pop(asyncio.get_running_loop(), {})
+
+        for client in loop_clients.values():
+            await client.aclose()
+
+
+rate_limiter = RateLimiter(
+    rate=settings.INTEGRATION_RATE_LIMIT,
+    burst=settings.INTEGRATION_RATE_BURST,
+    max_wait=settings.INTEGRATION_RATE_MAX_WAIT,
+)
+
+session_pool = SessionPool(
+    pool_maxsize=settings.INTEGRATION_POOL_MAXSIZE,
+    connect_timeout=settings.INTEGRATION_CONNECT_TIMEOUT,
+    read_timeout=settings.INTEGRATION_READ_TIMEOUT,
+    rate_limiter=rate_limiter,
+)
+
+async_session_pool = AsyncSessionPool(
+    pool_maxsize=settings.INTEGRATION_POOL_MAXSIZE,
+    connect_timeout=settings.INTEGRATION_CONNECT_TIMEOUT,
+    read_timeout=settings.INTEGRATION_READ_TIMEOUT,
+    rate_limiter=rate_limiter,
+)
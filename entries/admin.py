@@ -1,30 +1,130 @@
+import logging
+import operator
+from functools import reduce
 from typing import List, Tuple, Dict, Any
 
 from django import forms
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.admin.views.main import ChangeList
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.validators import EMPTY_VALUES
-from django.db.models import QuerySet
-from django.http import HttpRequest
+from django.db import transaction
+from django.db.models import Exists, OuterRef, QuerySet
+from django.http import HttpRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils import timezone
 from unfold.admin import ModelAdmin
 from unfold.admin import TabularInline
-from unfold.contrib.filters.admin import RangeDateFilter
-from unfold.widgets import UnfoldAdminSelectWidget, UnfoldAdminTextInputWidget
+from unfold.contrib.filters.admin import RangeDateFilter, RangeDateTimeFilter, RangeNumericFilter
+from unfold.decorators import action
+from unfold.widgets import UnfoldAdminSelectWidget, UnfoldAdminTextInputWidget, UnfoldAdminFileFieldWidget, \
+    UnfoldBooleanWidget
 
+from api_clients.jira import JiraApiClient
 from api_clients.rise import RiseApiClient
-from entries.models import Entry, JiraEntry, RiseEntry
-from entries.services import RiseAppService, JiraService
+from entries.integrations import registry
+from entries.models import Entry, IntegrationCallLog, JiraEntry, RiseEntry, SyncOutbox, TimesheetRollup
+from entries.services import BulkSyncService, JiraService, OutboxService, TimesheetImportService, \
+    TimesheetExportService
 from lib.utils import format_date
 from users.models import User
 
+logger = logging.getLogger(__name__)
+
 
 class CustomUnfoldSelectWidget(UnfoldAdminSelectWidget):
     pass
 
 
-class JiraEntryForm(forms.ModelForm):
+class ExistingObjectChoiceField(forms.ModelChoiceField):
+    """
+    Primary key field of an inline form that resolves the submitted pk from the objects the formset already loaded,
+    instead of running one query per form.
+    """
+
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value not in self.empty_values:
+            for obj in self.formset.get_queryset():
+                if str(obj.pk) == str(value):
+                    return obj
+
+        return super().to_python(value)
+
+
+class SharedParentFormSetMixin:
+    """
+    Hands every inline form the formset's parent Entry (and so its user) instead of each form loading its own copy.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        # Model formsets evaluate their queryset once and index into it for every form, so after the first call
+        # every object already has its parent
+        for obj in queryset:
+            if not self.fk.is_cached(obj):
+                setattr(obj, self.fk.name, self.instance)
+        return queryset
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+
+        pk_name = self.model._meta.pk.name
+        pk_field = form.fields.get(pk_name)
+        if isinstance(pk_field, forms.ModelChoiceField):
+            form.fields[pk_name] = ExistingObjectChoiceField(
+                self, pk_field.queryset, initial=pk_field.initial, required=False, widget=pk_field.widget
+            )
+
+
+class JiraIssueFormSetMixin:
+    """
+    Checks that the issues of new worklogs exist in Jira, with one search for the whole formset.
+    """
+
+    def clean(self):
+        super().clean()
+
+        forms_by_key = {}
+        for form in self.forms:
+            issue_key = getattr(form, "cleaned_data", {}).get("jira_issue_number")
+            if issue_key and "jira_issue_number" in form.changed_data and not self._should_delete_form(form):
+                forms_by_key.setdefault(JiraApiClient.normalize_issue_key(issue_key), []).append(form)
+
+        if not forms_by_key:
+            return
+
+        # The worklogs are pushed with the entry owner's Jira account
+        user = self.instance.user if self.instance.user_id else self.user
+        for issue_key in JiraService().get_unknown_issue_keys(user, forms_by_key):
+            for form in forms_by_key[issue_key]:
+                form.add_error("jira_issue_number", f"Jira issue {issue_key} does not exist or isn't visible to you.")
+
+
+class RemoteEntryFormMixin:
+    """
+    Inline forms of the integration models queue a push when a field the integration sends has changed.
+    """
+    queued_message = None
+
+    def clear_sync_state(self) -> None:
+        # Called before saving: a changed row counts as unsynced until the queued push succeeds
+        if registry.get_for_instance(self.instance).needs_sync(self.changed_data):
+            self.instance.last_synced_at = None
+
+    def queue_sync(self, instance) -> None:
+        # Queue the create/update in this transaction, pushed by EntryAdmin once it commits or by the sync worker
+        if registry.get_for_instance(instance).needs_sync(self.changed_data):
+            self.queued_message = OutboxService.enqueue_sync(instance=instance)
+
+
+class JiraEntryForm(RemoteEntryFormMixin, forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
         super(JiraEntryForm, self).__init__(*args, **kwargs)
@@ -38,6 +138,20 @@ class JiraEntryForm(forms.ModelForm):
             self.fields["last_synced_at"] = forms.DateTimeField(
                 widget=UnfoldAdminTextInputWidget(attrs={"disabled": "disabled"}), required=False, initial="-")
 
+            # Suggest issues while typing, see entries/js/jira_issue_autocomplete.js
+            self.fields["jira_issue_number"].widget.attrs.update({
+                "autocomplete": "off",
+                "data-jira-issues-url": reverse("admin:entries_entry_jira_issues"),
+            })
+
+    def clean_jira_issue_number(self):
+        issue_key = self.cleaned_data["jira_issue_number"]
+
+        # Saved issues are read-only, keep them as they are
+        if self.instance.pk:
+            return issue_key
+        return JiraApiClient.normalize_issue_key(issue_key)
+
     def clean(self):
         cleaned_data = super(JiraEntryForm, self).clean()
         if not all([self.user.jira_api_key, self.user.jira_email_address, self.user.jira_url]):
@@ -45,18 +159,19 @@ class JiraEntryForm(forms.ModelForm):
 
         return cleaned_data
 
+    def validate_unique(self):
+        # A saved worklog's issue is read-only and the formset checks the submitted issues against each other, so
+        # only query for clashes when the issue is new or was tampered with
+        if self.instance.pk and 'jira_issue_number' not in self.changed_data:
+            return
+
+        super(JiraEntryForm, self).validate_unique()
+
     def save(self, commit=True):
-        # Check if the specific field has changed
+        self.clear_sync_state()
         instance = super(JiraEntryForm, self).save(commit=commit)
-
-        if self.has_changed() and 'description' in self.changed_data or 'minutes_spent' in self.changed_data:
-            jira_client = JiraService()
-            if instance.jira_entry_id:
-                # Update the entry
-                jira_client.update_entry(jira_entry=instance)
-            else:
-                # Create the entry
-                jira_client.create_entry(jira_entry=instance)
+        if commit:
+            self.queue_sync(instance)
 
         return instance
 
@@ -71,13 +186,16 @@ class JiraEntryInline(TabularInline):
     can_delete = False
     extra = 0
 
+    class Media:
+        js = ("entries/js/jira_issue_autocomplete.js",)
+
     def get_formset(self, request, obj=None, **kwargs):
         """
         Override get_formset to pass user object into the formset's form initialization.
         """
         formset_class = super().get_formset(request, obj, **kwargs)
 
-        class CustomFormset(formset_class):
+        class CustomFormset(SharedParentFormSetMixin, JiraIssueFormSetMixin, formset_class):
             def __init__(self, *args, **kwargs):
                 # Inject the user's email into each form
                 self.user = request.user
@@ -92,7 +210,7 @@ class JiraEntryInline(TabularInline):
         return CustomFormset
 
 
-class RiseInlineForm(forms.ModelForm):
+class RiseInlineForm(RemoteEntryFormMixin, forms.ModelForm):
     rise_assignment_id = forms.ChoiceField(choices=[], label="RiseApp Project")
     rise_assignment_name = forms.CharField(widget=forms.HiddenInput(), required=False)
 
@@ -189,19 +307,11 @@ class RiseInlineForm(forms.ModelForm):
 
         # Save the form instance
         if commit:
+            self.clear_sync_state()
             instance.save()
+            self.queue_sync(instance)
 
-            # Check if the specific field has changed
-            if self.has_changed() and 'value' in self.changed_data or 'hours_worked' in self.changed_data:
-                rise_client = RiseAppService()
-                if instance.rise_entry_id:
-                    # Update the entry
-                    rise_client.update_entry(rise_entry=instance)
-                else:
-                    # Create the entry
-                    rise_client.create_entry(rise_entry=instance)
-
-                return instance
+        return instance
 
 
 class RiseInline(TabularInline):
@@ -221,7 +331,7 @@ class RiseInline(TabularInline):
         """
         formset_class = super().get_formset(request, obj, **kwargs)
 
-        class CustomFormset(formset_class):
+        class CustomFormset(SharedParentFormSetMixin, formset_class):
             def __init__(self, *args, **kwargs):
                 # Inject the user's email into each form
                 self.user = request.user
@@ -236,6 +346,24 @@ class RiseInline(TabularInline):
         return CustomFormset
 
 
+class TimesheetImportForm(forms.Form):
+    file = forms.FileField(widget=UnfoldAdminFileFieldWidget(), help_text="CSV (.csv) or JSON Lines (.jsonl)")
+    sync = forms.BooleanField(
+        widget=UnfoldBooleanWidget(), required=False, initial=True,
+        label="Sync imported entries to Jira/Rise",
+    )
+    validate_issues = forms.BooleanField(
+        widget=UnfoldBooleanWidget(), required=False, initial=True,
+        label="Skip rows whose Jira issue doesn't exist",
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data["file"]
+        if not file.name.lower().endswith((".csv", ".jsonl", ".ndjson")):
+            raise ValidationError("Please upload a .csv or .jsonl file.")
+        return file
+
+
 class CustomRangeDateFilter(RangeDateFilter):
     def queryset(self, request: HttpRequest, queryset: QuerySet) -> QuerySet | None:
         filters = {}
@@ -295,20 +423,54 @@ class CustomRangeDateFilter(RangeDateFilter):
         )
 
 
+class NeedsSyncFilter(admin.SimpleListFilter):
+    """
+    Entries with rows in any integration that were never pushed or changed since the last push. The subqueries match
+    the partial unsynced indexes.
+    """
+    title = "sync status"
+    parameter_name = "needs_sync"
+
+    ANY = "any"
+
+    def lookups(self, request, model_admin):
+        return [
+            (self.ANY, "Needs sync"),
+            *((integration.name, f"Needs {integration.label} sync") for integration in registry),
+        ]
+
+    def queryset(self, request, queryset):
+        pending = {
+            integration.name: Exists(integration.get_unsynced().filter(entry=OuterRef("pk")))
+            for integration in registry
+        }
+
+        if self.value() == self.ANY:
+            return queryset.filter(reduce(operator.or_, pending.values()))
+        if self.value() in pending:
+            return queryset.filter(pending[self.value()])
+
+        return queryset
+
+
 @admin.register(Entry)
 class EntryAdmin(ModelAdmin):
     inlines = [JiraEntryInline, RiseInline]
     list_display = ["user", "date_created", "total_jira_hours", "total_rise_hours"]
+    list_select_related = ["user"]
     list_filter_submit = True  # Submit button at the bottom of the filter
     list_filter = (
         ("date_created", CustomRangeDateFilter),
+        NeedsSyncFilter,
     )
+    actions = ["export_csv", "sync_selected", "delete_selected_remote"]
+    actions_list = ["import_timesheets"]
 
     def get_queryset(self, request):
         """
         Return the queryset for the admin list view based on user permissions.
         """
-        qs = super().get_queryset(request)
+        qs = super().get_queryset(request).select_related("user").with_totals()
 
         # Check if the user is a superuser
         if not request.user.is_superuser:
@@ -317,6 +479,161 @@ class EntryAdmin(ModelAdmin):
 
         return qs
 
+    def get_unsynced_counts(self, request) -> dict:
+        counts = {}
+        for integration in registry:
+            unsynced = integration.get_unsynced()
+            if not request.user.is_superuser:
+                unsynced = unsynced.filter(entry__user=request.user)
+            counts[integration.label] = unsynced.count()
+
+        return counts
+
+    def changelist_view(self, request, extra_context=None):
+        unsynced = self.get_unsynced_counts(request)
+        extra_context = {
+            "unsynced": unsynced,
+            "unsynced_total": sum(unsynced.values()),
+            "needs_sync_parameter": NeedsSyncFilter.parameter_name,
+            **(extra_context or {}),
+        }
+        return super().changelist_view(request, extra_context)
+
+    @action(description="Import timesheets", url_path="import-timesheets", permissions=["import_timesheets"])
+    def import_timesheets(self, request):
+        form = TimesheetImportForm(request.POST or None, request.FILES or None)
+
+        if request.method == "POST" and form.is_valid():
+            file = form.cleaned_data["file"]
+
+            # Non-superusers can only import their own timesheets
+            import_service = TimesheetImportService(
+                allowed_usernames=None if request.user.is_superuser else {request.user.username},
+                validate_issues=form.cleaned_data["validate_issues"],
+            )
+            results = import_service.run(
+                file,
+                file_format="csv" if file.name.lower().endswith(".csv") else "jsonl",
+                sync=form.cleaned_data["sync"],
+            )
+
+            messages.success(request, f"Imported {results['imported']} rows, queued {results['queued']} entries for syncing.")
+            if results["errors"]:
+                shown = "; ".join(f"line {line_no}: {error}" for line_no, error in results["errors"][:20])
+                messages.warning(request, f"Skipped {len(results['errors'])} invalid rows. {shown}")
+
+            return HttpResponseRedirect(reverse("admin:entries_entry_changelist"))
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Import timesheets",
+            "form": form,
+            "fields": TimesheetImportService.FIELDS,
+            "opts": self.model._meta,
+        }
+        return TemplateResponse(request, "admin/entries/entry/import_timesheets.html", context)
+
+    def has_import_timesheets_permission(self, request, object_id=None):
+        return self.has_add_permission(request)
+
+    def get_urls(self):
+        urls = super().get_urls()
+        export_urls = [
+            path("export-csv/", self.admin_site.admin_view(self.export_csv_view), name="entries_entry_export_csv"),
+            path("jira-issues/", self.admin_site.admin_view(self.jira_issues_view), name="entries_entry_jira_issues"),
+        ]
+        return export_urls + urls
+
+    @staticmethod
+    def get_export_response(queryset) -> StreamingHttpResponse:
+        response = StreamingHttpResponse(TimesheetExportService().stream_csv(queryset), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="timesheets-{timezone.localtime():%Y%m%d-%H%M}.csv"'
+        return response
+
+    @admin.action(description="Export selected entries to CSV", permissions=["view"])
+    def export_csv(self, request, queryset):
+        return self.get_export_response(queryset)
+
+    @staticmethod
+    def report_failures(request, failed: list) -> None:
+        if failed:
+            shown = "; ".join(f"{instance}: {error}" for instance, error in failed[:10])
+            messages.error(request, f"{len(failed)} remote calls failed. {shown}")
+
+    @admin.action(description="Sync selected entries to Jira and Rise", permissions=["change"])
+    def sync_selected(self, request, queryset):
+        results = BulkSyncService().sync_entries(queryset)
+
+        messages.success(request, f"Synced {len(results['succeeded'])} Jira/Rise entries.")
+        self.report_failures(request, results["failed"])
+
+    @admin.action(description="Delete selected entries (local and remote)", permissions=["delete"])
+    def delete_selected_remote(self, request, queryset):
+        results = BulkSyncService().delete_entries(queryset.select_related("user"))
+
+        messages.success(request, f"Deleted {len(results['deleted'])} timesheet entries.")
+        self.report_failures(request, results["failed"])
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+
+        # The built-in bulk delete would leave the remote worklogs and timesheets behind
+        actions.pop("delete_selected", None)
+
+        return actions
+
+    def export_csv_view(self, request):
+        """
+        Export everything the changelist would show for the same query string, e.g.
+        export-csv/?date_created_from=2024-01-01&date_created_to=2024-01-31
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        changelist = self.get_changelist_instance(request)
+        return self.get_export_response(changelist.get_queryset(request))
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+
+        if settings.SYNC_ON_SAVE:
+            message_ids = [
+                inline_form.queued_message.pk
+                for formset in formsets for inline_form in formset.forms
+                if getattr(inline_form, "queued_message", None)
+            ]
+            if message_ids:
+                # Push what the inline forms queued all at once after the save commits, so the user waits for the
+                # slowest call rather than every call in turn
+                transaction.on_commit(lambda: self.push_queued(request, message_ids))
+
+    def push_queued(self, request, message_ids: list) -> None:
+        results = OutboxService().process_now(message_ids)
+        if results["failed"]:
+            messages.warning(
+                request, f"{len(results['failed'])} Jira/Rise updates failed and will be retried in the background."
+            )
+
+    def jira_issues_view(self, request):
+        """
+        Issue suggestions for the worklog inline, e.g. jira-issues/?term=login
+        """
+        if not (self.has_add_permission(request) or self.has_change_permission(request)):
+            raise PermissionDenied
+
+        user = request.user
+        term = request.GET.get("term", "").strip()
+        suggestions = []
+        if len(term) >= 2 and all([user.jira_api_key, user.jira_email_address, user.jira_url]):
+            try:
+                suggestions = JiraApiClient(user=user).suggest_issues(term)
+            except Exception as e:
+                logger.warning("Jira issue search for %s failed: %s", user, e)
+
+        return JsonResponse({
+            "results": [{"id": issue["key"], "text": f"{issue['key']}: {issue['summary']}"} for issue in suggestions],
+        })
+
     def get_form(self, request, obj=None, **kwargs):
         # Get the form from the superclass
         form = super().get_form(request, obj, **kwargs)
@@ -331,5 +648,142 @@ class EntryAdmin(ModelAdmin):
         return form
 
 
+@admin.register(SyncOutbox)
+class SyncOutboxAdmin(ModelAdmin):
+    list_display = ["id", "user", "integration", "action", "object_id", "status", "attempts", "available_at", "processed_at"]
+    list_filter = ["status", "integration", "action"]
+    list_select_related = ["user"]
+    readonly_fields = ["user", "integration", "action", "object_id", "payload", "attempts", "last_error", "created_at", "processed_at"]
+    fields = readonly_fields + ["status", "available_at"]
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+
+        # Non-superusers only see their own sync messages
+        if not request.user.is_superuser:
+            qs = qs.filter(user=request.user)
+
+        return qs
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(TimesheetRollup)
+class TimesheetRollupAdmin(ModelAdmin):
+    list_display = ["period_start", "period_type", "user", "jira_hours", "rise_hours", "entry_count", "jira_entry_count", "updated_at"]
+    list_filter_submit = True
+    list_filter = ["period_type", ("period_start", RangeDateFilter)]
+    list_select_related = ["user"]
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+
+        # Non-superusers only see their own rollups
+        if not request.user.is_superuser:
+            qs = qs.filter(user=request.user)
+
+        return qs
+
+    # Rollups are maintained from the entries, see RollupService
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class CallEndpointFilter(admin.SimpleListFilter):
+    """
+    The endpoint templates the API clients log their calls under. Django's default filter would list the distinct
+    endpoints of the whole log on every page load.
+    """
+    title = "endpoint"
+    parameter_name = "endpoint"
+
+    def lookups(self, request, model_admin):
+        return [(endpoint, endpoint) for endpoint in sorted(JiraApiClient.endpoints + RiseApiClient.endpoints)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(endpoint=self.value())
+
+        return queryset
+
+
+class CallStatusFilter(admin.SimpleListFilter):
+    """
+    Response status classes, rather than a list of the distinct statuses in the log.
+    """
+    title = "status"
+    parameter_name = "status_class"
+
+    NO_RESPONSE = "none"
+    RATE_LIMITED = "429"
+    CLASSES = {
+        "2xx": (200, 300),
+        "3xx": (300, 400),
+        "4xx": (400, 500),
+        "5xx": (500, 600),
+    }
+
+    def lookups(self, request, model_admin):
+        return [
+            *((name, name) for name in self.CLASSES),
+            (self.RATE_LIMITED, "429 Too Many Requests"),
+            (self.NO_RESPONSE, "No response"),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() in self.CLASSES:
+            low, high = self.CLASSES[self.value()]
+            return queryset.filter(status__gte=low, status__lt=high)
+        if self.value() == self.RATE_LIMITED:
+            return queryset.filter(status=429)
+        if self.value() == self.NO_RESPONSE:
+            return queryset.filter(status__isnull=True)
+
+        return queryset
+
+
+@admin.register(IntegrationCallLog)
+class IntegrationCallLogAdmin(ModelAdmin):
+    list_display = ["created_at", "user", "integration", "method", "endpoint", "status", "duration_ms", "request_bytes", "response_bytes", "view"]
+    list_filter_submit = True
+    list_filter = [
+        "integration",
+        CallEndpointFilter,
+        CallStatusFilter,
+        ("duration_ms", RangeNumericFilter),
+        ("created_at", RangeDateTimeFilter),
+    ]
+    list_select_related = ["user"]
+    # Slowest calls first, the reason to open this page. The changelist adds -pk, calllog_duration_idx covers both
+    ordering = ["-duration_ms"]
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+
+        # Non-superusers only see their own calls
+        if not request.user.is_superuser:
+            qs = qs.filter(user=request.user)
+
+        return qs
+
+    # The log is append-only, written by the API clients and pruned by the prune_call_log command
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 # admin.site.register(RiseEntry, ModelAdmin)
 # admin.site.register(JiraEntry, ModelAdmin)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EntriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'entries'
+
+    def ready(self):
+        # Keep timesheet rollups up to date
+        import entries.signals  # noqa: F401
@@ -0,0 +1,265 @@
+"""
+Shared by the benchmark_admin and load_test commands: a local stand-in for the Jira and Rise APIs and helpers to
+seed synthetic users and timesheets.
+"""
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+
+from django.contrib.auth.models import Permission
+from django.utils import timezone
+
+from entries.models import Entry, JiraEntry, RiseEntry
+from lib.utils import FernetCipher
+from users.models import User
+
+# Assignment every synthetic Rise dashboard returns
+STUB_ASSIGNMENT_ID = 11
+
+
+class StubApiServer:
+    """
+    Answers the Jira worklog and issue search and Rise dashboard/timesheet endpoints the API clients call, after an
+    artificial latency. Counts the calls per endpoint. Runs on a background thread until stop() is called.
+    """
+
+    ROUTES = (
+        ("GET", re.compile(r"^/employees/dashboards/me/"), "rise.dashboard"),
+        ("POST", re.compile(r"^/employees/\d+/actions/log/"), "rise.create"),
+        ("POST", re.compile(r"^/timesheets/\w+/actions/edit_log/"), "rise.update"),
+        ("POST", re.compile(r"^/timesheets/\w+/actions/delete/"), "rise.delete"),
+        ("POST", re.compile(r"^/rest/api/3/issue/[^/]+/worklog$"), "jira.create"),
+        ("PUT", re.compile(r"^/rest/api/3/issue/[^/]+/worklog/\w+$"), "jira.update"),
+        ("DELETE", re.compile(r"^/rest/api/3/issue/[^/]+/worklog/\w+$"), "jira.delete"),
+        ("POST", re.compile(r"^/rest/api/3/search/jql$"), "jira.search"),
+    )
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls = Counter()
+        self._ids = count(1000)
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_method(self):
+                request_body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, body = stub.respond(self.command, self.path, request_body)
+
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_method
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubApiServer":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+    def respond(self, method: str, path: str, request_body: bytes = b"") -> tuple:
+        endpoint = next(
+            (name for route_method, pattern, name in self.ROUTES if route_method == method and pattern.match(path)),
+            None,
+        )
+        with self._lock:
+            self.calls[endpoint or "unknown"] += 1
+            remote_id = str(next(self._ids))
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if endpoint is None:
+            return 404, {"detail": "Not found"}
+        if endpoint == "rise.dashboard":
+            return 200, self.get_dashboard()
+        if endpoint in ("jira.delete", "rise.delete"):
+            return 204, {}
+        if endpoint == "jira.search":
+            return 200, self.search_issues(request_body)
+
+        return 200, {"id": remote_id}
+
+    @staticmethod
+    def search_issues(request_body: bytes) -> dict:
+        # Every issue key named in the JQL exists
+        jql = json.loads(request_body or b"{}").get("jql", "")
+        return {"issues": [
+            {"key": issue_key, "fields": {"summary": "Synthetic issue"}}
+            for issue_key in re.findall(r'"([A-Z][A-Z0-9_]*-\d+)"', jql)
+        ], "isLast": True}
+
+    @staticmethod
+    def get_dashboard() -> dict:
+        today = timezone.localdate()
+        start_date = str(today - timezone.timedelta(days=365))
+        end_date = str(today + timezone.timedelta(days=365))
+
+        return {
+            "tables": {
+                "assignments": [{
+                    "id": STUB_ASSIGNMENT_ID,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "milestone": {"start_date": start_date, "end_date": end_date, "project": {"name": "Benchmark"}},
+                }],
+                "global_projects": [],
+            }
+        }
+
+
+def create_user(username: str, stub_url: str, password: str = None) -> User:
+    """
+    Staff user with the entries permissions and credentials pointing at the stub server.
+    """
+    cipher = FernetCipher()
+    user = User.objects.create_user(
+        username=username,
+        password=password,
+        first_name=username,
+        is_staff=True,
+        rise_api_key=cipher.encrypt_value("stub"),
+        rise_user_id=1,
+        jira_api_key=cipher.encrypt_value("stub"),
+        jira_email_address=f"{username}@example.com",
+        jira_url=stub_url,
+    )
+    user.user_permissions.set(Permission.objects.filter(content_type__app_label="entries"))
+
+    return user
+
+
+def seed_entries(user: User, days: int, worklogs_per_day: int, synced: bool = True) -> list:
+    """
+    One Entry per day going back from today, each with Jira worklogs and a Rise timesheet.
+    """
+    today = timezone.localdate()
+    now = timezone.now() if synced else None
+
+    entries = Entry.objects.bulk_create(
+        [Entry(user=user, date_created=today - timezone.timedelta(days=day)) for day in range(days)]
+    )
+    JiraEntry.objects.bulk_create([
+        JiraEntry(
+            entry=entry, jira_issue_number=f"BENCH-{number}", minutes_spent=30, description="Synthetic worklog",
+            jira_entry_id=str(entry.pk * 100 + number) if synced else "", last_synced_at=now,
+        )
+        for entry in entries for number in range(worklogs_per_day)
+    ])
+    RiseEntry.objects.bulk_create([
+        RiseEntry(
+            entry=entry, value="Synthetic timesheet", hours_worked=8, rise_entry_id=str(entry.pk) if synced else "",
+            rise_assignment_id=str(STUB_ASSIGNMENT_ID), rise_assignment_name="Benchmark", last_synced_at=now,
+        )
+        for entry in entries
+    ])
+
+    return entries
+
+
+def get_add_form_data(user: User, date_created, worklogs: int) -> dict:
+    data = {
+        "user": user.pk,
+        "date_created": str(date_created),
+        "jiraentry_set-TOTAL_FORMS": worklogs,
+        "jiraentry_set-INITIAL_FORMS": 0,
+        "riseentry-TOTAL_FORMS": 1,
+        "riseentry-INITIAL_FORMS": 0,
+        "riseentry-0-value": "Synthetic timesheet",
+        "riseentry-0-hours_worked": "8",
+        "riseentry-0-rise_assignment_id": STUB_ASSIGNMENT_ID,
+    }
+    for number in range(worklogs):
+        data.update({
+            f"jiraentry_set-{number}-jira_issue_number": f"BENCH-{number}",
+            f"jiraentry_set-{number}-minutes_spent": 30,
+            f"jiraentry_set-{number}-description": "Synthetic worklog",
+        })
+
+    return data
+
+
+def get_change_form_data(entry: Entry, minutes_spent: int) -> dict:
+    """
+    Resubmit the entry with every worklog set to minutes_spent.
+    """
+    jira_entries = list(entry.jiraentry_set.order_by("pk"))
+    rise_entry = RiseEntry.objects.filter(entry=entry).first()
+
+    data = {
+        "user": entry.user_id,
+        "date_created": str(entry.date_created),
+        "jiraentry_set-TOTAL_FORMS": len(jira_entries),
+        "jiraentry_set-INITIAL_FORMS": len(jira_entries),
+        "riseentry-TOTAL_FORMS": 1,
+        "riseentry-INITIAL_FORMS": 1 if rise_entry else 0,
+        "riseentry-0-entry": entry.pk,
+        "riseentry-0-value": "Synthetic timesheet",
+        "riseentry-0-hours_worked": "8",
+        "riseentry-0-rise_assignment_id": STUB_ASSIGNMENT_ID,
+    }
+    if rise_entry:
+        data["riseentry-0-id"] = rise_entry.pk
+
+    for number, jira_entry in enumerate(jira_entries):
+        data.update({
+            f"jiraentry_set-{number}-id": jira_entry.pk,
+            f"jiraentry_set-{number}-entry": entry.pk,
+            f"jiraentry_set-{number}-jira_issue_number": jira_entry.jira_issue_number,
+            f"jiraentry_set-{number}-minutes_spent": minutes_spent,
+            f"jiraentry_set-{number}-description": jira_entry.description,
+        })
+
+    return data
+
+
+def percentile(values: list, percent: float) -> float:
+    # Nearest-rank percentile of already sorted values
+    if not values:
+        return 0.0
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def summarize(durations: list) -> dict:
+    durations = sorted(durations)
+    if not durations:
+        return {"count": 0}
+
+    return {
+        "count": len(durations),
+        "min_ms": round(durations[0] * 1000, 2),
+        "mean_ms": round(sum(durations) / len(durations) * 1000, 2),
+        "p50_ms": round(percentile(durations, 50) * 1000, 2),
+        "p95_ms": round(percentile(durations, 95) * 1000, 2),
+        "p99_ms": round(percentile(durations, 99) * 1000, 2),
+        "max_ms": round(durations[-1] * 1000, 2),
+    }
@@ -0,0 +1,112 @@
+"""
+Buffered writer for IntegrationCallLog. The API clients append to an in-memory buffer and a background thread writes
+it out with one bulk_create per batch, so logging a call never adds a DB round trip to the request that made it.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from entries.models import IntegrationCallLog
+from lib.metrics import CALL_LOG_DROPPED
+
+logger = logging.getLogger(__name__)
+
+
+class CallLogBuffer:
+
+    def __init__(self, batch_size: int, flush_interval: float, max_size: int) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # When the database can't keep up the oldest calls are dropped, not the request that made the newest
+        self._records = deque(maxlen=max_size)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer_pid = None
+
+    def record(self, **fields) -> None:
+        if not settings.CALL_LOG_ENABLED:
+            return
+
+        with self._lock:
+            if len(self._records) == self._records.maxlen:
+                self._dropped += 1
+                CALL_LOG_DROPPED.labels("buffer_full").inc()
+            self._records.append(IntegrationCallLog(**fields))
+            full = len(self._records) >= self.batch_size
+
+            # Threads don't survive a fork, so every worker process starts its own writer
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                threading.Thread(target=self.run, name="call-log-writer", daemon=True).start()
+
+        if full:
+            self._wakeup.set()
+
+    def write(self) -> int:
+        with self._lock:
+            records = list(self._records)
+            self._records.clear()
+            dropped, self._dropped = self._dropped, 0
+
+        # Logged here rather than per call, so a full buffer doesn't flood the log from every request
+        if dropped:
+            logger.warning("Dropped %d integration call log record(s), the buffer was full", dropped)
+
+        if records:
+            try:
+                IntegrationCallLog.objects.bulk_create(records, batch_size=self.batch_size)
+            except Exception:
+                CALL_LOG_DROPPED.labels("write_failed").inc(len(records))
+                logger.exception("Dropped %d integration call log record(s)", len(records))
+
+        return len(records)
+
+    def flush(self) -> int:
+        """
+        Write out everything buffered so far, waiting for a write in progress on the writer thread.
+        """
+        with self._write_lock:
+            return self.write()
+
+    def run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+            with self._write_lock:
+                try:
+                    self.write()
+                finally:
+                    # Don't hold a connection between flushes
+                    connection.close()
+
+
+def prune(retention_days: int, batch_size: int = 5000) -> int:
+    """
+    Delete calls older than retention_days, batch_size rows per statement so the table is never locked for long.
+    """
+    cutoff = timezone.now() - timezone.timedelta(days=retention_days)
+    deleted = 0
+
+    while True:
+        ids = list(IntegrationCallLog.objects.filter(created_at__lt=cutoff).values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IntegrationCallLog.objects.filter(pk__in=ids).delete()[0]
+
+
+call_log = CallLogBuffer(
+    batch_size=settings.CALL_LOG_BATCH_SIZE,
+    flush_interval=settings.CALL_LOG_FLUSH_INTERVAL,
+    max_size=settings.CALL_LOG_MAX_BUFFER,
+)
+atexit.register(call_log.flush)
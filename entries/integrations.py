@@ -0,0 +1,126 @@
+"""
+Registry of the remote systems entries are pushed to.
+
+Each integration declares its API client, its local model and how a row is pushed and deleted. The outbox, bulk
+sync, admin forms and filters and the models' delete() go through the registry instead of branching on Jira/Rise,
+so batching, pooling and retries apply to every integration, and a new one only needs a subclass registered here
+and a matching SyncOutbox.INTEGRATION_CHOICES entry.
+"""
+from api_clients.jira import JiraApiClient
+from api_clients.rise import RiseApiClient
+from api_clients.sessions import SessionPool
+from entries.models import JiraEntry, RiseEntry, SyncOutbox
+
+
+class Integration:
+    # Key stored in SyncOutbox.integration
+    name = None
+    label = None
+    model = None
+    client_class = None
+    # Field holding the id of the remote record, empty until the row was first pushed
+    remote_id_field = None
+    # Form fields whose change needs a push
+    sync_trigger_fields = ()
+    # Values an outbox delete needs once the local row is gone
+    delete_payload_fields = ()
+
+    @property
+    def sync_fields(self) -> list:
+        # Written by the clients after a push, bulk updated when the push was made with save=False
+        return [self.remote_id_field, "last_synced_at", "payload_hash"]
+
+    def get_client(self, instance):
+        return self.client_class(user=instance.entry.user)
+
+    def get_host(self, instance) -> str:
+        # Users can point at different sites, ask the client the row would be pushed with
+        return SessionPool.get_host_key(self.get_client(instance).base_url or "")
+
+    def get_remote_id(self, instance) -> str:
+        return getattr(instance, self.remote_id_field)
+
+    def get_delete_payload(self, instance) -> dict:
+        return {field: getattr(instance, field) for field in self.delete_payload_fields}
+
+    def get_unsynced(self):
+        return self.model.objects.unsynced()
+
+    def needs_sync(self, changed_data: list) -> bool:
+        return any(field in changed_data for field in self.sync_trigger_fields)
+
+    def push(self, instance, save: bool = True) -> None:
+        # Create the remote record, or update it if it was pushed before
+        client = self.get_client(instance)
+        if self.get_remote_id(instance):
+            client.update_entry(instance, save=save)
+        else:
+            client.create_entry(instance, save=save)
+
+    def delete(self, instance) -> None:
+        self.get_client(instance).delete_entry(instance)
+
+    async def apush(self, instance) -> None:
+        client = self.get_client(instance)
+        if self.get_remote_id(instance):
+            await client.aupdate_entry(instance)
+        else:
+            await client.acreate_entry(instance)
+
+    async def adelete(self, instance) -> None:
+        await self.get_client(instance).adelete_entry(instance)
+
+
+class IntegrationRegistry:
+
+    def __init__(self) -> None:
+        self._integrations = {}
+
+    def register(self, integration_class):
+        integration = integration_class()
+        self._integrations[integration.name] = integration
+        return integration_class
+
+    def get(self, name: str) -> Integration:
+        return self._integrations[name]
+
+    def get_for_model(self, model) -> Integration:
+        for integration in self:
+            if integration.model is model:
+                return integration
+        raise LookupError(f"No integration is registered for {model.__name__}")
+
+    def get_for_instance(self, instance) -> Integration:
+        return self.get_for_model(type(instance))
+
+    @property
+    def names(self) -> list:
+        return list(self._integrations)
+
+    def __iter__(self):
+        return iter(self._integrations.values())
+
+
+registry = IntegrationRegistry()
+
+
+@registry.register
+class JiraIntegration(Integration):
+    name = SyncOutbox.JIRA
+    label = "Jira"
+    model = JiraEntry
+    client_class = JiraApiClient
+    remote_id_field = "jira_entry_id"
+    sync_trigger_fields = ("description", "minutes_spent")
+    delete_payload_fields = ("jira_issue_number", "jira_entry_id")
+
+
+@registry.register
+class RiseIntegration(Integration):
+    name = SyncOutbox.RISE
+    label = "Rise"
+    model = RiseEntry
+    client_class = RiseApiClient
+    remote_id_field = "rise_entry_id"
+    sync_trigger_fields = ("value", "hours_worked")
+    delete_payload_fields = ("rise_entry_id",)
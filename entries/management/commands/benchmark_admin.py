@@ -0,0 +1,143 @@
+import json
+import time
+from collections import Counter
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from api_clients.jira import JiraApiClient
+from api_clients.rise import RiseApiClient
+from entries.call_log import call_log
+from entries.benchmarks import StubApiServer, create_user, get_add_form_data, get_change_form_data, seed_entries, \
+    summarize
+from entries.services import DashboardService, OutboxService
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the EntryAdmin list, add and change views in a throwaway test database, against a local stand-in "
+        "for the Jira and Rise APIs. Records wall time, query counts and outbound calls per scenario as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10, help="Runs per scenario")
+        parser.add_argument("--latency", type=float, default=50, help="Stub API latency in milliseconds")
+        parser.add_argument("--days", type=int, default=90, help="Days of synthetic entries to seed")
+        parser.add_argument("--worklogs", type=int, default=5, help="Jira worklogs per day")
+        parser.add_argument("--output", default="benchmark-results.json", help="File the JSON results are written to")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a release tag")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        stub = StubApiServer(latency=options["latency"] / 1000).start()
+
+        try:
+            with override_settings(RISE_API_URL=stub.url):
+                results = self.run_scenarios(stub, options)
+        finally:
+            stub.stop()
+            # Let a write in progress finish, the test database can't be dropped while it's connected
+            call_log.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "label": options["label"],
+            "created_at": timezone.now().isoformat(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "settings": {key: options[key] for key in ("iterations", "latency", "days", "worklogs")},
+            "scenarios": results,
+        }
+        with open(options["output"], "w") as file:
+            json.dump(report, file, indent=2)
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<22} p50 {result['wall']['p50_ms']:>8}ms  p95 {result['wall']['p95_ms']:>8}ms  "
+                f"queries {result['queries']['max']:>4}  outbound {result['outbound_calls']['per_iteration']:>5}  "
+                f"errors {result['errors']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_scenarios(self, stub: StubApiServer, options: dict) -> dict:
+        user = create_user("benchmark", stub_url=stub.url)
+        entries = seed_entries(user, days=options["days"], worklogs_per_day=options["worklogs"])
+        entry = entries[0]
+
+        client = Client()
+        client.force_login(user)
+
+        changelist_url = reverse("admin:entries_entry_changelist")
+        add_url = reverse("admin:entries_entry_add")
+        change_url = reverse("admin:entries_entry_change", args=[entry.pk])
+        next_day = timezone.localdate()
+
+        def add_save(iteration):
+            # Every iteration adds a new day after the seeded ones
+            return client.post(add_url, get_add_form_data(
+                user, next_day + timezone.timedelta(days=iteration + 1), worklogs=options["worklogs"]
+            ))
+
+        scenarios = {
+            "admin_index": (lambda iteration: client.get(reverse("admin:index")), 200),
+            "changelist": (lambda iteration: client.get(changelist_url), 200),
+            "changelist_needs_sync": (lambda iteration: client.get(f"{changelist_url}?needs_sync=any"), 200),
+            "add_view": (lambda iteration: client.get(add_url), 200),
+            "add_save": (add_save, 302),
+            "change_view": (lambda iteration: client.get(change_url), 200),
+            # Alternate the minutes so every save is a real change that queues a sync
+            "change_save": (lambda iteration: client.post(
+                change_url, get_change_form_data(entry, minutes_spent=30 + iteration % 2 * 15)
+            ), 302),
+            "outbox_drain": (lambda iteration: OutboxService().process_batch(batch_size=1000), None),
+        }
+
+        results = {}
+        for name, (operation, expected_status) in scenarios.items():
+            durations, queries, calls, errors = [], [], Counter(), 0
+
+            for iteration in range(options["iterations"]):
+                if name == "outbox_drain":
+                    if iteration == 0:
+                        # Start from an empty outbox, the saves above queued pushes of their own
+                        OutboxService().process_batch(batch_size=1000)
+
+                    # Queue something to push: each drain follows a change, left to the worker instead of being
+                    # pushed right after the save
+                    with override_settings(SYNC_ON_SAVE=False):
+                        client.post(change_url, get_change_form_data(entry, minutes_spent=31 + iteration))
+
+                # Measure cold caches, the first request of a user after they expire
+                JiraApiClient.clear_cache(user)
+                RiseApiClient.clear_cache(user)
+                DashboardService.clear_cache()
+                stub.reset()
+
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = operation(iteration)
+                    durations.append(time.perf_counter() - started)
+
+                queries.append(len(context.captured_queries))
+                calls.update(stub.calls)
+                if expected_status and response.status_code != expected_status:
+                    errors += 1
+
+            results[name] = {
+                "wall": summarize(durations),
+                "queries": {"min": min(queries), "max": max(queries), "mean": round(sum(queries) / len(queries), 2)},
+                "outbound_calls": {
+                    "per_iteration": round(sum(calls.values()) / options["iterations"], 2),
+                    "by_endpoint": dict(calls),
+                },
+                "errors": errors,
+            }
+
+        return results
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from entries.services import JiraService
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Import worklogs users logged directly in Jira, fetching only what changed since the previous run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", dest="usernames", action="append", default=[],
+                            help="Username to import for, can be repeated. Defaults to all users with a Jira config")
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(jira_api_key__isnull=True).exclude(jira_api_key="").exclude(jira_url__isnull=True)
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+
+        jira_service = JiraService()
+        for user in users:
+            try:
+                results = jira_service.import_worklogs(user=user)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{user.username}: import failed ({e})"))
+                continue
+
+            self.stdout.write(f"{user.username}: imported {results['imported']}, skipped {results['skipped']}")
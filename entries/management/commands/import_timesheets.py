@@ -0,0 +1,42 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from entries.services import TimesheetImportService
+
+
+class Command(BaseCommand):
+    help = (
+        "Import timesheets from a CSV or JSON Lines file with the columns: "
+        + ", ".join(TimesheetImportService.FIELDS)
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import")
+        parser.add_argument("--format", choices=TimesheetImportService.FORMATS,
+                            help="File format, guessed from the extension by default")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows validated and loaded at a time")
+        parser.add_argument("--sync", action="store_true",
+                            help="Queue the imported entries for the sync worker to push to Jira/Rise")
+        parser.add_argument("--validate-issues", action="store_true",
+                            help="Skip rows whose Jira issue doesn't exist, checked with each user's Jira account")
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or ("csv" if options["path"].lower().endswith(".csv") else "jsonl")
+        if not os.path.exists(options["path"]):
+            raise CommandError(f"{options['path']} does not exist")
+
+        import_service = TimesheetImportService(
+            chunk_size=options["chunk_size"], validate_issues=options["validate_issues"]
+        )
+        with open(options["path"], "rb") as file:
+            results = import_service.run(file, file_format=file_format, sync=options["sync"])
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {results['imported']} rows"))
+        if options["sync"]:
+            self.stdout.write(f"Queued {results['queued']} entries for syncing")
+
+        if results["errors"]:
+            self.stdout.write(self.style.ERROR(f"Skipped {len(results['errors'])} invalid rows:"))
+            for line_no, error in results["errors"]:
+                self.stdout.write(f"  line {line_no}: {error}")
@@ -0,0 +1,190 @@
+import json
+import queue
+import re
+import secrets
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from entries.benchmarks import StubApiServer, create_user, get_add_form_data, get_change_form_data, summarize
+from entries.models import Entry, JiraEntry, RiseEntry
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent admin users through the Entry add and edit flows against a running server, with the Jira "
+        "and Rise APIs replaced by a local stand-in. Reports throughput, latency percentiles and error rates. "
+        "The server must use the same database and have RISE_API_URL pointing at the stand-in (--stub-url)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://localhost:8200", help="Server under test")
+        parser.add_argument("--users", type=int, default=20, help="Synthetic users to create and log in")
+        parser.add_argument("--concurrency", type=int, default=10, help="Users submitting at the same time")
+        parser.add_argument("--duration", type=float, default=60, help="Seconds to keep submitting")
+        parser.add_argument("--worklogs", type=int, default=3, help="Jira worklogs per submitted day")
+        parser.add_argument("--latency", type=float, default=200, help="Stand-in API latency in milliseconds")
+        parser.add_argument("--stub-bind", default="127.0.0.1:9100", help="host:port the API stand-in listens on")
+        parser.add_argument("--stub-url", help="URL the server reaches the stand-in on. Defaults to --stub-bind")
+        parser.add_argument("--prefix", default="loadtest", help="Username prefix of the synthetic users")
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic users and their entries")
+        parser.add_argument("--output", help="Also write the report to this JSON file")
+
+    def handle(self, *args, **options):
+        if options["users"] < options["concurrency"]:
+            raise CommandError("--users must be at least --concurrency, a user only submits one day at a time")
+
+        host, port = options["stub_bind"].rsplit(":", 1)
+        stub = StubApiServer(host=host, port=int(port), latency=options["latency"] / 1000).start()
+        stub_url = options["stub_url"] or stub.url
+        if settings.RISE_API_URL != stub_url:
+            self.stdout.write(self.style.WARNING(
+                f"RISE_API_URL is {settings.RISE_API_URL}, the server must use {stub_url} to hit the stand-in"
+            ))
+
+        password = secrets.token_urlsafe(16)
+        users = [
+            create_user(f"{options['prefix']}-{number}", stub_url=stub_url, password=password)
+            for number in range(options["users"])
+        ]
+
+        try:
+            report = self.run_load(users, password, options)
+        finally:
+            stub.stop()
+            if not options["keep"]:
+                self.delete_users(users)
+
+        report["outbound_calls"] = dict(stub.calls)
+        self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+
+    def run_load(self, users: list, password: str, options: dict) -> dict:
+        base_url = options["base_url"].rstrip("/")
+        timings = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+
+        def call(step, session, method, path, expected_status, data=None):
+            started = time.perf_counter()
+            try:
+                response = session.request(method, f"{base_url}{path}", data=data, allow_redirects=False, timeout=60)
+                ok = response.status_code == expected_status
+            except requests.RequestException:
+                response, ok = None, False
+
+            with lock:
+                timings[step].append(time.perf_counter() - started)
+                if not ok:
+                    errors[step] += 1
+
+            return response if ok else None
+
+        def login(user):
+            session = requests.Session()
+            call("login_form", session, "GET", "/admin/login/", 200)
+            call("login", session, "POST", "/admin/login/?next=/admin/", 302, data={
+                "csrfmiddlewaretoken": session.cookies.get("csrftoken", ""),
+                "username": user.username,
+                "password": password,
+            })
+            return session
+
+        def submit_day(user, session, day):
+            """
+            Add a day with Jira and Rise inlines, then open and edit it like a user correcting their timesheet.
+            """
+            call("add_view", session, "GET", "/admin/entries/entry/add/", 200)
+            response = call("add_save", session, "POST", "/admin/entries/entry/add/", 302, data={
+                **get_add_form_data(user, day, worklogs=options["worklogs"]),
+                "csrfmiddlewaretoken": session.cookies.get("csrftoken", ""),
+                "_continue": "1",
+            })
+
+            # "Save and continue editing" redirects to the new entry's change page
+            match = response and re.search(r"/entry/(\d+)/change/", response.headers.get("Location", ""))
+            if not match:
+                return
+
+            change_path = f"/admin/entries/entry/{match.group(1)}/change/"
+            call("change_view", session, "GET", change_path, 200)
+            call("change_save", session, "POST", change_path, 302, data={
+                **get_change_form_data(Entry.objects.get(pk=match.group(1)), minutes_spent=45),
+                "csrfmiddlewaretoken": session.cookies.get("csrftoken", ""),
+            })
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            sessions = list(executor.map(login, users))
+
+        # Users wait in a queue between submissions so one user never submits two days at once
+        idle_users = queue.Queue()
+        for user, session in zip(users, sessions):
+            idle_users.put((user, session, timezone.localdate()))
+
+        submitted = []
+        deadline = time.monotonic() + options["duration"]
+
+        def worker():
+            try:
+                while time.monotonic() < deadline:
+                    user, session, day = idle_users.get()
+                    try:
+                        submit_day(user, session, day)
+                    finally:
+                        idle_users.put((user, session, day - timezone.timedelta(days=1)))
+                    with lock:
+                        submitted.append(day)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            for future in [executor.submit(worker) for _ in range(options["concurrency"])]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        steps = {
+            step: {**summarize(durations), "errors": errors[step], "error_rate": round(errors[step] / len(durations), 4)}
+            for step, durations in timings.items()
+        }
+        load_requests = sum(steps[step]["count"] for step in steps if not step.startswith("login"))
+
+        return {
+            "created_at": timezone.now().isoformat(),
+            "settings": {key: options[key] for key in ("base_url", "users", "concurrency", "duration", "worklogs", "latency")},
+            "elapsed_seconds": round(elapsed, 2),
+            "days_submitted": len(submitted),
+            "days_per_second": round(len(submitted) / elapsed, 2),
+            "requests_per_second": round(load_requests / elapsed, 2),
+            "steps": steps,
+        }
+
+    def print_report(self, report: dict) -> None:
+        self.stdout.write(
+            f"{report['days_submitted']} days submitted in {report['elapsed_seconds']}s: "
+            f"{report['days_per_second']} days/s, {report['requests_per_second']} requests/s"
+        )
+        for step, result in report["steps"].items():
+            self.stdout.write(
+                f"{step:<12} n {result['count']:>6}  p50 {result['p50_ms']:>8}ms  p95 {result['p95_ms']:>8}ms  "
+                f"p99 {result['p99_ms']:>8}ms  errors {result['error_rate']:.2%}"
+            )
+        self.stdout.write(f"Outbound calls to the stand-in: {report['outbound_calls']}")
+
+    @staticmethod
+    def delete_users(users: list) -> None:
+        # Queryset deletes skip JiraEntry/RiseEntry.delete(), nothing should be pushed to the stand-in after it's gone
+        JiraEntry.objects.filter(entry__user__in=users).delete()
+        RiseEntry.objects.filter(entry__user__in=users).delete()
+        Entry.objects.filter(user__in=users).delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
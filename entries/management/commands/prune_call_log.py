@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from entries import call_log
+
+
+class Command(BaseCommand):
+    help = "Delete integration call log records older than the retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.CALL_LOG_RETENTION_DAYS,
+                            help="Days of calls to keep. Defaults to CALL_LOG_RETENTION_DAYS")
+
+    def handle(self, *args, **options):
+        deleted = call_log.prune(retention_days=options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} call log record(s)"))
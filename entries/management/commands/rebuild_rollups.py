@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from entries.services import RollupService
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Recompute the weekly and monthly timesheet rollups from the stored entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First entry date (YYYY-MM-DD). Defaults to all time")
+        parser.add_argument("--to", dest="date_to", help="Last entry date (YYYY-MM-DD). Defaults to all time")
+        parser.add_argument("--user", dest="usernames", action="append", default=[],
+                            help="Username to rebuild for, can be repeated. Defaults to all users")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for option in ("date_from", "date_to"):
+            if options[option]:
+                dates[option] = parse_date(options[option])
+                if not dates[option]:
+                    raise CommandError("--from and --to must be dates in the YYYY-MM-DD format")
+
+        user_ids = None
+        if options["usernames"]:
+            user_ids = list(User.objects.filter(username__in=options["usernames"]).values_list("pk", flat=True))
+
+        written = RollupService().rebuild(user_ids=user_ids, **dates)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollups"))
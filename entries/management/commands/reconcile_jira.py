@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from api_clients.jira import JiraApiClient
+from entries.models import JiraEntry
+from entries.services import JiraService, OutboxService, RollupService
+
+
+class Command(BaseCommand):
+    help = "Check stored Jira worklogs against Jira in bulk and report (or fix) entries that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", required=True, help="First entry date (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="date_to", required=True, help="Last entry date (YYYY-MM-DD)")
+        parser.add_argument("--user", dest="usernames", action="append", default=[],
+                            help="Username to reconcile, can be repeated. Defaults to all users")
+        parser.add_argument("--fix", choices=["push", "pull"],
+                            help="push: queue local values to Jira (re-creating deleted worklogs). "
+                                 "pull: take Jira's values and drop local entries deleted in Jira")
+
+    def handle(self, *args, **options):
+        date_from, date_to = parse_date(options["date_from"]), parse_date(options["date_to"])
+        if not date_from or not date_to:
+            raise CommandError("--from and --to must be dates in the YYYY-MM-DD format")
+
+        queryset = JiraEntry.objects.select_related("entry__user").filter(
+            entry__date_created__gte=date_from,
+            entry__date_created__lte=date_to,
+        )
+        if options["usernames"]:
+            queryset = queryset.filter(entry__user__username__in=options["usernames"])
+
+        results = JiraService().reconcile(list(queryset))
+
+        self.stdout.write(f"In sync: {len(results['in_sync'])}")
+        for label, key in (("Deleted in Jira", "missing"), ("Never synced", "unsynced")):
+            self.stdout.write(f"{label}: {len(results[key])}")
+            for jira_entry in results[key]:
+                self.stdout.write(f"  #{jira_entry.pk} {jira_entry.jira_issue_number} | {jira_entry}")
+
+        self.stdout.write(f"Edited in Jira: {len(results['edited'])}")
+        for jira_entry, worklog in results["edited"]:
+            self.stdout.write(
+                f"  #{jira_entry.pk} {jira_entry.jira_issue_number} | {jira_entry} | "
+                f"local {jira_entry.minutes_spent}m, Jira {worklog.get('timeSpentSeconds', 0) // 60}m"
+            )
+
+        if options["fix"] == "push":
+            self.push(results)
+        elif options["fix"] == "pull":
+            self.pull(results)
+
+    @transaction.atomic
+    def push(self, results):
+        # Forget worklogs that are gone so the worker creates them again
+        missing_ids = [jira_entry.pk for jira_entry in results["missing"]]
+        JiraEntry.objects.filter(pk__in=missing_ids).update(jira_entry_id="", last_synced_at=None)
+
+        to_push = results["missing"] + results["unsynced"] + [jira_entry for jira_entry, _ in results["edited"]]
+        for jira_entry in to_push:
+            OutboxService.enqueue_sync(instance=jira_entry)
+
+        self.stdout.write(self.style.SUCCESS(f"Queued {len(to_push)} entries to be pushed to Jira"))
+
+    @transaction.atomic
+    def pull(self, results):
+        for jira_entry, worklog in results["edited"]:
+            jira_entry.minutes_spent = worklog.get("timeSpentSeconds", 0) // 60
+            jira_entry.description = JiraApiClient.get_comment_text(worklog.get("comment"))
+            jira_entry.payload_hash = JiraApiClient.get_worklog_hash(JiraApiClient.get_worklog_payload(jira_entry))
+        JiraEntry.objects.bulk_update(
+            [jira_entry for jira_entry, _ in results["edited"]], ["minutes_spent", "description", "payload_hash"]
+        )
+        # bulk_update doesn't send post_save, so the rollups are refreshed by hand
+        RollupService.rebuild_days(
+            {(jira_entry.entry.user_id, jira_entry.entry.date_created) for jira_entry, _ in results["edited"]}
+        )
+
+        # Queryset delete skips JiraEntry.delete(), these worklogs no longer exist remotely
+        JiraEntry.objects.filter(pk__in=[jira_entry.pk for jira_entry in results["missing"]]).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {len(results['edited'])} and removed {len(results['missing'])} local entries from Jira"
+        ))
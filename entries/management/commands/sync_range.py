@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from entries.integrations import registry
+from entries.models import SyncOutbox
+from entries.services import BulkSyncService
+
+
+class Command(BaseCommand):
+    help = "Push unsynced Jira/Rise entries for a set of users and a date range to the remote APIs in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", required=True, help="First entry date (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="date_to", required=True, help="Last entry date (YYYY-MM-DD)")
+        parser.add_argument("--user", dest="usernames", action="append", default=[],
+                            help="Username to sync, can be repeated. Defaults to all users")
+        parser.add_argument("--integration", choices=registry.names, action="append",
+                            help="Only sync this integration, can be repeated. Defaults to all")
+        parser.add_argument("--include-synced", action="store_true",
+                            help="Also re-push entries that were synced before")
+        parser.add_argument("--workers", type=int, default=8, help="Maximum concurrent remote calls")
+        parser.add_argument("--per-host", type=int, default=4, help="Maximum concurrent remote calls per host")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be synced")
+
+    def handle(self, *args, **options):
+        date_from, date_to = parse_date(options["date_from"]), parse_date(options["date_to"])
+        if not date_from or not date_to:
+            raise CommandError("--from and --to must be dates in the YYYY-MM-DD format")
+
+        integrations = options["integration"] or registry.names
+        instances = []
+        for integration in integrations:
+            instances.extend(self.get_queryset(integration, date_from, date_to, options))
+
+        self.stdout.write(f"Found {len(instances)} entr{'y' if len(instances) == 1 else 'ies'} to sync")
+        if options["dry_run"] or not instances:
+            return
+
+        def progress(done, total):
+            if done % 50 == 0 or done == total:
+                self.stdout.write(f"  {done}/{total}")
+
+        bulk_sync_service = BulkSyncService(max_workers=options["workers"], per_host=options["per_host"])
+        results = bulk_sync_service.run(instances, progress=progress)
+
+        self.stdout.write(self.style.SUCCESS(f"Synced {len(results['succeeded'])} entries"))
+        if results["failed"]:
+            self.stdout.write(self.style.ERROR(f"Failed to sync {len(results['failed'])} entries:"))
+            for instance, error in results["failed"]:
+                self.stdout.write(f"  {instance} (#{instance.pk}): {error}")
+
+    @staticmethod
+    def get_queryset(integration, date_from, date_to, options):
+        queryset = registry.get(integration).model.objects.select_related("entry__user").filter(
+            entry__date_created__gte=date_from,
+            entry__date_created__lte=date_to,
+        )
+
+        if options["usernames"]:
+            queryset = queryset.filter(entry__user__username__in=options["usernames"])
+
+        if not options["include_synced"]:
+            queryset = queryset.unsynced()
+
+        # Leave rows the sync worker is about to push alone
+        pending = SyncOutbox.objects.filter(integration=integration, status=SyncOutbox.PENDING)
+        return queryset.exclude(pk__in=pending.values("object_id")).order_by("entry__date_created", "pk")
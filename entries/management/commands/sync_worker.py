@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from entries import call_log
+from entries.services import OutboxService
+
+
+class Command(BaseCommand):
+    help = "Drain the sync outbox, pushing queued Jira/Rise changes. Several workers can run side by side."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50, help="Messages claimed and pushed, one at a time, per batch")
+        parser.add_argument("--poll-interval", type=float, default=2, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--once", action="store_true", help="Drain what is currently due and exit")
+        parser.add_argument("--prune-interval", type=float, default=3600,
+                            help="Seconds between prunes of the integration call log, 0 to never prune")
+
+    def handle(self, *args, **options):
+        outbox_service = OutboxService()
+        processed = 0
+        pruned_at = None
+
+        try:
+            while True:
+                close_old_connections()
+
+                if options["prune_interval"] and (
+                    pruned_at is None or time.monotonic() - pruned_at >= options["prune_interval"]
+                ):
+                    call_log.prune(retention_days=settings.CALL_LOG_RETENTION_DAYS)
+                    pruned_at = time.monotonic()
+
+                count = outbox_service.process_batch(batch_size=options["batch_size"])
+                processed += count
+
+                if count:
+                    self.stdout.write(f"Processed {count} sync message(s)")
+                elif options["once"]:
+                    break
+                else:
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Sync worker stopped after {processed} message(s)"))
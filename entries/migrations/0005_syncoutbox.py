@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entries', '0004_alter_entry_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('integration', models.CharField(choices=[('jira', 'Jira'), ('rise', 'Rise')], max_length=20)),
+                ('action', models.CharField(choices=[('sync', 'Sync'), ('delete', 'Delete')], max_length=20)),
+                ('object_id', models.BigIntegerField(help_text='Primary key of the local Jira/Rise entry')),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Remote identifiers needed once the local row is gone')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sync Outbox Message',
+                'verbose_name_plural': 'Sync Outbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='syncoutbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entries', '0005_syncoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JiraImportState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jira_account_id', models.CharField(blank=True, max_length=128)),
+                ('updated_since', models.BigIntegerField(default=0, help_text='Epoch milliseconds of the last imported change')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Jira Import State',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entries', '0006_jiraimportstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimesheetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_type', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('jira_minutes', models.PositiveIntegerField(default=0)),
+                ('rise_hours', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('entry_count', models.PositiveIntegerField(default=0)),
+                ('jira_entry_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Timesheet Rollup',
+                'ordering': ['-period_start'],
+                'unique_together': {('user', 'period_type', 'period_start')},
+            },
+        ),
+    ]
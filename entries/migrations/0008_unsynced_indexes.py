@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0007_timesheetrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='jiraentry',
+            index=models.Index(condition=models.Q(('jira_entry_id', ''), ('last_synced_at__isnull', True), _connector='OR'), fields=['entry'], name='jiraentry_unsynced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='riseentry',
+            index=models.Index(condition=models.Q(('rise_entry_id', ''), ('last_synced_at__isnull', True), _connector='OR'), fields=['entry'], name='riseentry_unsynced_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0008_unsynced_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jiraentry',
+            name='payload_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the worklog payload Jira last accepted', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='riseentry',
+            name='payload_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the timesheet update payload matching what Rise last accepted', max_length=64),
+        ),
+    ]
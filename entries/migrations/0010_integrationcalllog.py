@@ -0,0 +1,39 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entries', '0009_payload_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntegrationCallLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('integration', models.CharField(choices=[('jira', 'Jira'), ('rise', 'Rise')], max_length=20)),
+                ('method', models.CharField(max_length=10)),
+                ('endpoint', models.CharField(help_text='Path template, e.g. /rest/api/3/issue/{key}/worklog', max_length=255)),
+                ('status', models.PositiveSmallIntegerField(blank=True, help_text='Empty when no response was received', null=True)),
+                ('duration_ms', models.PositiveIntegerField(verbose_name='Latency (ms)')),
+                ('request_bytes', models.PositiveIntegerField(default=0)),
+                ('response_bytes', models.PositiveIntegerField(default=0)),
+                ('view', models.CharField(blank=True, help_text='Admin view the call was made from', max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Integration Call',
+                'verbose_name_plural': 'Integration Call Log',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='calllog_created_idx'), models.Index(fields=['-duration_ms'], name='calllog_duration_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0010_integrationcalllog'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='integrationcalllog',
+            name='calllog_duration_idx',
+        ),
+        migrations.AddIndex(
+            model_name='integrationcalllog',
+            index=models.Index(fields=['-duration_ms', '-id'], name='calllog_duration_idx'),
+        ),
+    ]
@@ -1,12 +1,59 @@
 from django.db import models
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
 
 from users.models import User
 
 
+class EntryQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate Jira minutes and Rise hours in a single grouped query.
+        """
+        return self.annotate(
+            jira_minutes_total=Sum('jiraentry__minutes_spent'),
+            rise_hours_total=Max('riseentry__hours_worked'),
+        )
+
+
+# Never pushed, or changed locally since the last push (queuing a change clears last_synced_at). Shared with the
+# partial indexes so the planner can use them
+JIRA_UNSYNCED = Q(jira_entry_id="") | Q(last_synced_at__isnull=True)
+RISE_UNSYNCED = Q(rise_entry_id="") | Q(last_synced_at__isnull=True)
+
+
+class JiraEntryQuerySet(models.QuerySet):
+    def unsynced(self):
+        return self.filter(JIRA_UNSYNCED)
+
+
+class RiseEntryQuerySet(models.QuerySet):
+    def unsynced(self):
+        return self.filter(RISE_UNSYNCED)
+
+
+class RemoteEntryMixin:
+    """
+    Rows pushed to an integration in entries.integrations.
+    """
+
+    def delete(self, *args, **kwargs):
+        # Queue the remote deletion, the sync worker picks it up once this transaction commits
+        from entries.integrations import registry
+        from entries.services import OutboxService
+        if registry.get_for_instance(self).get_remote_id(self):
+            OutboxService.enqueue_delete(instance=self)
+
+        # Proceed with the actual deletion
+        super().delete(*args, **kwargs)
+
+
 class Entry(models.Model):
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     date_created = models.DateField()
 
+    objects = EntryQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'date_created')
         verbose_name = "Timesheet Entry"
@@ -18,6 +65,10 @@ class Entry(models.Model):
 
     @property
     def total_jira_hours(self):
+        # Use the annotated total when the entry was loaded via with_totals()
+        if hasattr(self, 'jira_minutes_total'):
+            return round((self.jira_minutes_total or 0) / 60, 2)
+
         jira_entries = self.jiraentry_set.all()
         total_minutes = 0
 
@@ -31,41 +82,41 @@ class Entry(models.Model):
 
     @property
     def total_rise_hours(self):
+        if hasattr(self, 'rise_hours_total'):
+            return self.rise_hours_total
+
         if self.riseentry:
             return self.riseentry.hours_worked
 
 
-class JiraEntry(models.Model):
+class JiraEntry(RemoteEntryMixin, models.Model):
     entry = models.ForeignKey(Entry, on_delete=models.PROTECT)
     jira_issue_number = models.CharField(max_length=255)
     minutes_spent = models.IntegerField()
     description = models.TextField()
     jira_entry_id = models.CharField(max_length=20)
     last_synced_at = models.DateTimeField(null=True)
+    payload_hash = models.CharField(max_length=64, blank=True, editable=False,
+                                    help_text="Hash of the worklog payload Jira last accepted")
+
+    objects = JiraEntryQuerySet.as_manager()
 
     @property
     def synced(self):
         return self.jira_entry_id is not None
 
-    def delete(self, *args, **kwargs):
-        # Custom code before deletion
-        from entries.services import JiraService
-        if self.jira_entry_id:
-            jira_service = JiraService()
-            jira_service.delete_entry(jira_entry=self)
-
-        # Proceed with the actual deletion
-        super().delete(*args, **kwargs)
-
     def __str__(self):
         return f'Jira Worklog | {self.entry.user.get_full_name()} | {self.entry.date_created}'
 
     class Meta:
         unique_together = ('entry', 'jira_issue_number')
         verbose_name_plural = 'Jira Entries'
+        indexes = [
+            models.Index(fields=['entry'], condition=JIRA_UNSYNCED, name='jiraentry_unsynced_idx'),
+        ]
 
 
-class RiseEntry(models.Model):
+class RiseEntry(RemoteEntryMixin, models.Model):
     ASSIGNMENT = 'assignment'
     PROJECT = 'project'
 
@@ -77,16 +128,10 @@ class RiseEntry(models.Model):
     rise_assignment_name = models.CharField(max_length=255)
     last_synced_at = models.DateTimeField(null=True)
     log_type = models.CharField(max_length=200, default=ASSIGNMENT)
+    payload_hash = models.CharField(max_length=64, blank=True, editable=False,
+                                    help_text="Hash of the timesheet update payload matching what Rise last accepted")
 
-    def delete(self, *args, **kwargs):
-        # Custom code before deletion
-        from entries.services import RiseAppService
-        if self.rise_entry_id:
-            rise_app_service = RiseAppService()
-            rise_app_service.delete_entry(rise_entry=self)
-
-        # Proceed with the actual deletion
-        super().delete(*args, **kwargs)
+    objects = RiseEntryQuerySet.as_manager()
 
     @property
     def synced(self):
@@ -95,6 +140,135 @@ class RiseEntry(models.Model):
     def __str__(self):
         return f'Rise Timesheet Entry | {self.entry.user.get_full_name()} | {self.entry.date_created}'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['entry'], condition=RISE_UNSYNCED, name='riseentry_unsynced_idx'),
+        ]
+
+
+class SyncOutbox(models.Model):
+    JIRA = 'jira'
+    RISE = 'rise'
+    INTEGRATION_CHOICES = (
+        (JIRA, 'Jira'),
+        (RISE, 'Rise'),
+    )
+
+    SYNC = 'sync'
+    DELETE = 'delete'
+    ACTION_CHOICES = (
+        (SYNC, 'Sync'),
+        (DELETE, 'Delete'),
+    )
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    integration = models.CharField(max_length=20, choices=INTEGRATION_CHOICES)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    object_id = models.BigIntegerField(help_text="Primary key of the local Jira/Rise entry")
+    payload = models.JSONField(default=dict, blank=True, help_text="Remote identifiers needed once the local row is gone")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Sync Outbox Message"
+        verbose_name_plural = "Sync Outbox"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='syncoutbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_integration_display()} {self.action} #{self.object_id} | {self.status}'
+
+
+class JiraImportState(models.Model):
+    """
+    Per-user high-water mark of the Jira worklog updated feed, so imports only fetch what changed since the last run.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    jira_account_id = models.CharField(max_length=128, blank=True)
+    updated_since = models.BigIntegerField(default=0, help_text="Epoch milliseconds of the last imported change")
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Jira Import State"
+
+    def __str__(self):
+        return f'Jira Import | {self.user.get_full_name()} | {self.updated_since}'
+
+
+class TimesheetRollup(models.Model):
+    """
+    Precomputed per-user totals for a week or month, kept up to date by the signal handlers in entries.signals.
+    """
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = (
+        (WEEK, 'Week'),
+        (MONTH, 'Month'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    period_type = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    jira_minutes = models.PositiveIntegerField(default=0)
+    rise_hours = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    entry_count = models.PositiveIntegerField(default=0)
+    jira_entry_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'period_type', 'period_start')
+        verbose_name = "Timesheet Rollup"
+        ordering = ['-period_start']
+
+    def __str__(self):
+        return f'{self.user} | {self.get_period_type_display()} of {self.period_start}'
+
+    @property
+    def jira_hours(self):
+        return round(self.jira_minutes / 60, 2)
 
 
+class IntegrationCallLog(models.Model):
+    """
+    One row per call made by the Jira/Rise API clients. Written in batches by entries.call_log, pruned by the
+    prune_call_log command.
+    """
+    # No FK constraint: rows are written after the call, possibly once the user is gone, and a failed insert would
+    # lose the whole batch
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    integration = models.CharField(max_length=20, choices=SyncOutbox.INTEGRATION_CHOICES)
+    method = models.CharField(max_length=10)
+    endpoint = models.CharField(max_length=255, help_text="Path template, e.g. /rest/api/3/issue/{key}/worklog")
+    status = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Empty when no response was received")
+    duration_ms = models.PositiveIntegerField(verbose_name="Latency (ms)")
+    request_bytes = models.PositiveIntegerField(default=0)
+    response_bytes = models.PositiveIntegerField(default=0)
+    view = models.CharField(max_length=255, blank=True, help_text="Admin view the call was made from")
+    created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        verbose_name = "Integration Call"
+        verbose_name_plural = "Integration Call Log"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='calllog_created_idx'),
+            models.Index(fields=['-duration_ms', '-id'], name='calllog_duration_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_integration_display()} {self.method} {self.endpoint} | {self.status or "error"} | {self.duration_ms}ms'
@@ -1,41 +1,1159 @@
+import asyncio
+import contextvars
+import csv
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal, InvalidOperation
+from functools import partial, reduce
+from itertools import islice
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, router, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.deletion import Collector
+from django.db.models.functions import Greatest, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
 from api_clients.jira import JiraApiClient
-from api_clients.rise import RiseApiClient
-from entries.models import RiseEntry, JiraEntry
+from lib.cache import TTLCache
+from entries.integrations import registry
+from entries.models import Entry, RiseEntry, JiraEntry, SyncOutbox, JiraImportState, TimesheetRollup
 from users.models import User
 
+logger = logging.getLogger(__name__)
 
-class RiseAppService:
+
+class JiraService:
     @staticmethod
     def get_client(user: User):
-        return RiseApiClient(user=user)
+        return JiraApiClient(user=user)
 
-    def create_entry(self, rise_entry: RiseEntry) -> None:
-        rise_client = self.get_client(user=rise_entry.entry.user)
-        rise_client.create_entry(rise_entry=rise_entry)
+    def get_unknown_issue_keys(self, user: User, issue_keys) -> set:
+        """
+        The keys among issue_keys (normalized) that aren't issues the user can see, checked with one search per 100
+        uncached keys. Returns nothing when Jira can't be asked, a wrong key then still fails when it's pushed.
+        """
+        if not all([user.jira_api_key, user.jira_email_address, user.jira_url]):
+            return set()
 
-    def update_entry(self, rise_entry: RiseEntry) -> None:
-        rise_client = self.get_client(user=rise_entry.entry.user)
-        rise_client.update_entry(rise_entry=rise_entry)
+        issue_keys = {JiraApiClient.normalize_issue_key(issue_key) for issue_key in issue_keys}
+        try:
+            issues = self.get_client(user=user).get_issues(issue_keys)
+        except Exception as e:
+            logger.warning("Could not check the Jira issues of %s: %s", user, e)
+            return set()
 
-    def delete_entry(self, rise_entry: RiseEntry) -> None:
-        rise_client = self.get_client(user=rise_entry.entry.user)
-        rise_client.delete_entry(rise_entry=rise_entry)
+        return issue_keys - issues.keys()
 
+    def reconcile(self, jira_entries: list) -> dict:
+        """
+        Compare local Jira entries against their remote worklogs, with one worklog list call per 1000 synced entries
+        of a user. Returns the drift grouped as "missing" (deleted remotely), "edited" ((entry, remote worklog) pairs),
+        "unsynced" (never pushed) and "in_sync".
+        """
+        results = {"missing": [], "edited": [], "unsynced": [], "in_sync": []}
+
+        entries_by_user = {}
+        for jira_entry in jira_entries:
+            if not jira_entry.jira_entry_id:
+                results["unsynced"].append(jira_entry)
+            else:
+                entries_by_user.setdefault(jira_entry.entry.user, []).append(jira_entry)
+
+        for user, user_entries in entries_by_user.items():
+            jira_client = self.get_client(user=user)
+            worklogs = jira_client.get_worklogs([jira_entry.jira_entry_id for jira_entry in user_entries])
+            worklogs_by_id = {str(worklog["id"]): worklog for worklog in worklogs}
+
+            for jira_entry in user_entries:
+                worklog = worklogs_by_id.get(str(jira_entry.jira_entry_id))
+                if worklog is None:
+                    results["missing"].append(jira_entry)
+                elif worklog.get("timeSpentSeconds") != jira_entry.minutes_spent * 60 \
+                        or jira_client.get_comment_text(worklog.get("comment")).strip() != jira_entry.description.strip():
+                    results["edited"].append((jira_entry, worklog))
+                else:
+                    results["in_sync"].append(jira_entry)
+
+        return results
+
+    def import_worklogs(self, user: User) -> dict:
+        """
+        Import the user's own worklogs changed in Jira since the last run, upserting JiraEntry rows (and their day's
+        Entry). Returns counts of imported and skipped worklogs.
+        """
+        jira_client = self.get_client(user=user)
+        state, _ = JiraImportState.objects.get_or_create(user=user)
+        if not state.jira_account_id:
+            state.jira_account_id = jira_client.get_myself()["accountId"]
+
+        worklog_ids, until = jira_client.get_updated_worklog_ids(since=state.updated_since)
+        worklogs = [
+            worklog for worklog in jira_client.get_worklogs(worklog_ids)
+            if worklog.get("author", {}).get("accountId") == state.jira_account_id
+        ]
+        issue_keys = jira_client.get_issue_keys(sorted({str(worklog["issueId"]) for worklog in worklogs}))
+
+        # Local changes still waiting for the sync worker win over what Jira has
+        pending_ids = SyncOutbox.objects.filter(
+            user=user, integration=SyncOutbox.JIRA, status=SyncOutbox.PENDING
+        ).values("object_id")
+        local_rows = JiraEntry.objects.filter(entry__user=user).exclude(jira_entry_id="")
+        protected_ids = set(local_rows.filter(pk__in=pending_ids).values_list("jira_entry_id", flat=True))
+
+        rows = {}
+        skipped = 0
+        for worklog in worklogs:
+            issue_key = issue_keys.get(str(worklog["issueId"]))
+            started = parse_datetime(worklog["started"])
+            if not issue_key or not started or str(worklog["id"]) in protected_ids:
+                skipped += 1
+                continue
+
+            date_created = timezone.localtime(started).date()
+            key = (date_created, issue_key)
+            if key in rows:
+                # One row per issue per day, extra worklogs on the same issue and day can't be represented
+                skipped += 1
+                continue
+
+            rows[key] = worklog
+
+        # Don't overwrite a local row that is linked to a different worklog on the same issue and day
+        linked_ids = {
+            (date_created, issue_key): jira_entry_id
+            for date_created, issue_key, jira_entry_id in local_rows.filter(
+                entry__date_created__in={key[0] for key in rows}
+            ).values_list("entry__date_created", "jira_issue_number", "jira_entry_id")
+        }
+        for key, worklog in list(rows.items()):
+            if linked_ids.get(key, str(worklog["id"])) != str(worklog["id"]):
+                del rows[key]
+                skipped += 1
+
+        with transaction.atomic():
+            Entry.objects.bulk_create(
+                [Entry(user=user, date_created=date_created) for date_created in {key[0] for key in rows}],
+                ignore_conflicts=True,
+            )
+            entries = dict(
+                Entry.objects.filter(user=user, date_created__in={key[0] for key in rows}).values_list("date_created", "pk")
+            )
+
+            now = timezone.now()
+            jira_entries = []
+            for (date_created, issue_key), worklog in rows.items():
+                jira_entry = JiraEntry(
+                    entry=Entry(pk=entries[date_created], user=user, date_created=date_created),
+                    jira_issue_number=issue_key,
+                    minutes_spent=worklog.get("timeSpentSeconds", 0) // 60,
+                    description=jira_client.get_comment_text(worklog.get("comment")),
+                    jira_entry_id=str(worklog["id"]),
+                    last_synced_at=now,
+                )
+                # Jira holds these values already, so the next sync doesn't need to send them back
+                jira_entry.payload_hash = jira_client.get_worklog_hash(jira_client.get_worklog_payload(jira_entry))
+                jira_entries.append(jira_entry)
+
+            JiraEntry.objects.bulk_create(
+                jira_entries,
+                update_conflicts=True,
+                unique_fields=["entry", "jira_issue_number"],
+                update_fields=["minutes_spent", "description", "jira_entry_id", "last_synced_at", "payload_hash"],
+            )
+
+            if rows:
+                dates = [date_created for date_created, _ in rows]
+                RollupService().rebuild(user_ids=[user.pk], date_from=min(dates), date_to=max(dates))
+
+            state.updated_since = until
+            state.last_run_at = now
+            state.save()
+
+        return {"imported": len(rows), "skipped": skipped}
+
+
+class OutboxService:
+    """
+    Records sync intents in the same transaction as the entry they belong to, and drains them from the
+    sync_worker management command.
+    """
 
-class JiraService:
     @staticmethod
-    def get_client(user: User):
-        return JiraApiClient(user=user)
+    def enqueue_sync(instance: JiraEntry | RiseEntry) -> SyncOutbox:
+        # Until the push succeeds the row is unsynced, for the needs-sync filter, the counts and sync_range
+        if instance.last_synced_at:
+            type(instance).objects.filter(pk=instance.pk).update(last_synced_at=None)
+            instance.last_synced_at = None
+
+        return SyncOutbox.objects.create(
+            user_id=instance.entry.user_id,
+            integration=registry.get_for_instance(instance).name,
+            action=SyncOutbox.SYNC,
+            object_id=instance.pk,
+        )
+
+    @staticmethod
+    def enqueue_delete(instance: JiraEntry | RiseEntry) -> SyncOutbox:
+        integration = registry.get_for_instance(instance)
+
+        # The local row is gone by the time the worker runs, so keep the remote identifiers
+        return SyncOutbox.objects.create(
+            user_id=instance.entry.user_id,
+            integration=integration.name,
+            action=SyncOutbox.DELETE,
+            object_id=instance.pk,
+            payload=integration.get_delete_payload(instance),
+        )
+
+    @staticmethod
+    def enqueue_sync_queryset(queryset) -> int:
+        """
+        Queue a sync for every Jira/Rise entry in the queryset with a single INSERT ... SELECT. Returns the row count.
+        """
+        integration = registry.get_for_model(queryset.model).name
+        select_sql, select_params = queryset.order_by().values_list("entry__user_id", "pk").query.sql_with_params()
+        now = timezone.now()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {SyncOutbox._meta.db_table}
+                    (user_id, object_id, integration, action, payload, status, attempts, last_error, available_at, created_at)
+                SELECT selected.*, %s, %s, %s, %s, 0, '', %s, %s FROM ({select_sql}) selected
+                """,
+                [integration, SyncOutbox.SYNC, "{}", SyncOutbox.PENDING, now, now] + list(select_params),
+            )
+            return cursor.rowcount
+
+    @staticmethod
+    def claim(queryset, limit: int = None) -> list:
+        """
+        Lock the queryset's messages that are due, skipping rows other workers hold, and lease them: they aren't due
+        again until SYNC_OUTBOX_LEASE seconds from now, when a worker that died mid-push has its messages retried.
+        The lease counts as an attempt. Commits before returning, so no lock is held while the messages are pushed.
+        """
+        now = timezone.now()
+        lease_until = now + timezone.timedelta(seconds=settings.SYNC_OUTBOX_LEASE)
+
+        with transaction.atomic():
+            messages = queryset.select_for_update(skip_locked=True, of=("self",)).filter(
+                status=SyncOutbox.PENDING, available_at__lte=now
+            ).select_related("user").order_by("id")
+            messages = list(messages[:limit] if limit else messages)
+            SyncOutbox.objects.filter(pk__in=[message.pk for message in messages]).update(
+                attempts=F("attempts") + 1, available_at=lease_until
+            )
+
+        for message in messages:
+            message.attempts += 1
+            message.available_at = lease_until
+
+        return messages
+
+    def process_batch(self, batch_size: int = 50) -> int:
+        """
+        Claim and push due messages one at a time, up to batch_size. Returns the number processed.
+        """
+        processed = 0
+        while processed < batch_size:
+            messages = self.claim(SyncOutbox.objects.all(), limit=1)
+            if not messages:
+                break
+
+            self.process_message(messages[0])
+            processed += 1
+
+        return processed
+
+    RESULT_FIELDS = ["status", "last_error", "available_at", "processed_at"]
+
+    def process_message(self, message: SyncOutbox) -> None:
+        # Outside any transaction: the client saves the remote id as soon as the call returns, so a retry after a
+        # crash updates the remote record instead of creating it a second time
+        try:
+            self.dispatch(message)
+        except Exception as e:
+            self.record_result(message, error=e)
+        else:
+            self.record_result(message)
+
+        message.save(update_fields=self.RESULT_FIELDS)
+
+    @staticmethod
+    def record_result(message: SyncOutbox, error: Exception = None) -> None:
+        """
+        Mark a claimed message done if its attempt succeeded, otherwise schedule a retry with backoff. Doesn't save it.
+        """
+        if error is None:
+            message.status = SyncOutbox.DONE
+            message.last_error = ""
+            message.processed_at = timezone.now()
+            return
+
+        logger.warning("Sync outbox message %s failed (attempt %s): %s", message.pk, message.attempts, error)
+        message.last_error = str(error)
+
+        if message.attempts >= settings.SYNC_OUTBOX_MAX_ATTEMPTS:
+            message.status = SyncOutbox.FAILED
+        else:
+            # Exponential backoff, capped at an hour
+            delay = min(settings.SYNC_OUTBOX_RETRY_BACKOFF * 2 ** (message.attempts - 1), 3600)
+            message.available_at = timezone.now() + timezone.timedelta(seconds=delay)
+
+    def process_now(self, message_ids: list) -> dict:
+        """
+        Push the rows of just-queued sync messages concurrently instead of waiting for the sync worker, then write
+        the rows and the messages back in one transaction, with one batch update each. Messages a worker already
+        claimed are skipped and failed pushes stay queued for the worker's retries. Returns the BulkSyncService.run()
+        results.
+        """
+        # The lease keeps a worker from pushing the same rows a second time
+        messages = self.claim(SyncOutbox.objects.filter(pk__in=message_ids, action=SyncOutbox.SYNC))
+
+        instances = {}
+        for integration in registry:
+            object_ids = [message.object_id for message in messages if message.integration == integration.name]
+            if object_ids:
+                for instance in integration.model.objects.select_related("entry__user").filter(pk__in=object_ids):
+                    instances[(integration.name, instance.pk)] = instance
+
+        results = BulkSyncService().run(
+            list(instances.values()), operation=partial(BulkSyncService.push_entry, save=False)
+        )
+
+        errors = {
+            (registry.get_for_instance(instance).name, instance.pk): error for instance, error in results["failed"]
+        }
+        for message in messages:
+            # A row deleted before the push needs nothing, like in dispatch()
+            self.record_result(message, error=errors.get((message.integration, message.object_id)))
+
+        with transaction.atomic():
+            BulkSyncService.save_results(results["succeeded"])
+            SyncOutbox.objects.bulk_update(messages, self.RESULT_FIELDS)
+
+        return results
+
+    def dispatch(self, message: SyncOutbox) -> None:
+        integration = registry.get(message.integration)
+
+        if message.action == SyncOutbox.DELETE:
+            # Rebuild an unsaved instance from the stored identifiers
+            instance = integration.model(pk=message.object_id, entry=Entry(user=message.user), **message.payload)
+            integration.delete(instance)
+            return
+
+        instance = integration.model.objects.select_related("entry__user").filter(pk=message.object_id).first()
+        if instance is None:
+            # Deleted locally before it was ever pushed
+            return
+
+        integration.push(instance)
+
+
+class BulkSyncService:
+    """
+    Runs remote calls for many Jira/Rise entries on a bounded thread pool, capping concurrent calls per host.
+    """
+
+    def __init__(self, max_workers: int = 8, per_host: int = 4) -> None:
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_host(instance: JiraEntry | RiseEntry) -> str:
+        return registry.get_for_instance(instance).get_host(instance)
+
+    @staticmethod
+    def push_entry(instance: JiraEntry | RiseEntry, save: bool = True) -> None:
+        registry.get_for_instance(instance).push(instance, save=save)
+
+    @staticmethod
+    def delete_remote(instance: JiraEntry | RiseEntry) -> None:
+        registry.get_for_instance(instance).delete(instance)
+
+    def get_host_limit(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def call(self, operation, instance):
+        try:
+            with self.get_host_limit(self.get_host(instance)):
+                return operation(instance)
+        finally:
+            # Each pool thread gets its own DB connection, don't leave it open
+            connection.close()
+
+    def run(self, instances: list, operation=None, progress=None) -> dict:
+        """
+        Apply operation (push_entry by default) to every instance. Returns the succeeded instances and the failed
+        (instance, error) pairs. progress, if given, is called with (done, total) as calls complete.
+        """
+        operation = operation or self.push_entry
+        results = {"succeeded": [], "failed": []}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Run every call in a copy of the caller's context, so its outbound calls are recorded against the view
+            futures = {
+                executor.submit(contextvars.copy_context().run, self.call, operation, instance): instance
+                for instance in instances
+            }
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                instance = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning("Bulk sync of %r failed: %s", instance, e)
+                    results["failed"].append((instance, e))
+                else:
+                    results["succeeded"].append(instance)
+
+                if progress:
+                    progress(done, len(futures))
+
+        return results
+
+    @staticmethod
+    def get_instances(entries) -> list:
+        # Every row of the entries in every integration, with what the clients and host lookups need
+        return [
+            instance
+            for integration in registry
+            for instance in integration.model.objects.select_related("entry__user").filter(entry__in=entries)
+        ]
+
+    def sync_entries(self, entries) -> dict:
+        """
+        Push every Jira/Rise row of the entries concurrently, then record the new remote ids and sync times in one
+        transaction. Returns the run() results.
+        """
+        results = self.run(self.get_instances(entries), operation=partial(self.push_entry, save=False))
+
+        with transaction.atomic():
+            self.save_results(results["succeeded"])
+
+            for integration in registry:
+                # Queued pushes of these rows are now redundant
+                SyncOutbox.objects.filter(
+                    integration=integration.name,
+                    action=SyncOutbox.SYNC,
+                    status=SyncOutbox.PENDING,
+                    object_id__in=[
+                        instance.pk for instance in results["succeeded"] if isinstance(instance, integration.model)
+                    ],
+                ).update(status=SyncOutbox.DONE, processed_at=timezone.now())
+
+        return results
+
+    @staticmethod
+    def save_results(instances: list) -> None:
+        """
+        Write the remote ids and sync times of rows pushed with save=False, one bulk update per integration.
+        """
+        with transaction.atomic():
+            for integration in registry:
+                integration.model.objects.bulk_update(
+                    [instance for instance in instances if isinstance(instance, integration.model)],
+                    integration.sync_fields,
+                )
+
+            user_ids = list({instance.entry.user_id for instance in instances})
+            transaction.on_commit(lambda: DashboardService.clear_cache(user_ids=user_ids))
+
+    def delete_entries(self, entries) -> dict:
+        """
+        Delete the remote worklogs and timesheets of the entries concurrently, then delete locally in one transaction
+        whatever is gone remotely. Entries keep any row whose remote delete failed. Returns the deleted entries and
+        the failed (instance, error) pairs.
+        """
+        entries = list(entries)
+        instances = self.get_instances(entries)
+        results = self.run([
+            instance for instance in instances if registry.get_for_instance(instance).get_remote_id(instance)
+        ], operation=self.delete_remote)
+
+        failed = {(type(instance), instance.pk) for instance, _ in results["failed"]}
+        kept_entry_ids = {instance.entry_id for instance, _ in results["failed"]}
+        deleted_entries = [entry for entry in entries if entry.pk not in kept_entry_ids]
+
+        with transaction.atomic():
+            # Remote deletes are done, so skip the models' delete() and their outbox messages.
+            # The collector reuses the loaded instances, so the delete signals don't query their entries again.
+            for model, objs in (
+                *((integration.model, [instance for instance in instances if isinstance(instance, integration.model)])
+                  for integration in registry),
+                (Entry, deleted_entries),
+            ):
+                objs = [obj for obj in objs if (model, obj.pk) not in failed]
+                if objs:
+                    collector = Collector(using=router.db_for_write(model))
+                    collector.collect(objs)
+                    collector.delete()
+
+        return {"deleted": deleted_entries, "failed": results["failed"]}
+
+    @staticmethod
+    async def apush_entry(instance: JiraEntry | RiseEntry) -> None:
+        await registry.get_for_instance(instance).apush(instance)
+
+    async def arun(self, instances: list, operation=None) -> dict:
+        """
+        Async counterpart of run(): all calls share the event loop, bounded per host by semaphores instead of threads.
+        Instances must be loaded with select_related("entry__user").
+        """
+        operation = operation or self.apush_entry
+        host_limits = {}
+        results = {"succeeded": [], "failed": []}
+
+        async def call(instance):
+            try:
+                host = self.get_host(instance)
+                if host not in host_limits:
+                    host_limits[host] = asyncio.Semaphore(self.per_host)
+
+                async with host_limits[host]:
+                    await operation(instance)
+            except Exception as e:
+                logger.warning("Bulk sync of %r failed: %s", instance, e)
+                results["failed"].append((instance, e))
+            else:
+                results["succeeded"].append(instance)
+
+        await asyncio.gather(*(call(instance) for instance in instances))
+        return results
+
+
+class TimesheetImportService:
+    """
+    Streams timesheets from CSV or JSON Lines into Entry, JiraEntry and RiseEntry rows.
+
+    Rows are validated in chunks. On PostgreSQL every chunk is COPY'd into a temporary staging table which is then
+    merged into the real tables with one INSERT ... ON CONFLICT per table, other databases fall back to bulk_create.
+    A row may carry a Jira worklog, a Rise entry or both; later rows win over earlier ones for the same day/issue.
+    """
+
+    FIELDS = [
+        "username", "date", "jira_issue_number", "minutes_spent", "description",
+        "rise_value", "rise_hours", "rise_assignment_id", "rise_log_type",
+    ]
+    FORMATS = ("csv", "jsonl")
+    # Values the staging table and the model columns can hold, checked so a bad row doesn't abort the whole import
+    MAX_LENGTHS = {
+        "jira_issue_number": JiraEntry._meta.get_field("jira_issue_number").max_length,
+        "rise_assignment_id": RiseEntry._meta.get_field("rise_assignment_id").max_length,
+        "rise_log_type": RiseEntry._meta.get_field("log_type").max_length,
+    }
+    MAX_MINUTES = 2 ** 31 - 1
+
+    def __init__(self, chunk_size: int = 5000, allowed_usernames: set = None, validate_issues: bool = False) -> None:
+        self.chunk_size = chunk_size
+        self.allowed_usernames = allowed_usernames
+        self.validate_issues = validate_issues
+        self.user_ids = {}
+
+    def read_rows(self, file, file_format: str):
+        # Yields (line number, row dict) without reading the whole file into memory
+        text = io.TextIOWrapper(file, encoding="utf-8-sig") if not isinstance(file, io.TextIOBase) else file
+
+        if file_format == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(text, start=1):
+                if line.strip():
+                    try:
+                        yield line_no, json.loads(line)
+                    except ValueError:
+                        yield line_no, None
+
+    def resolve_users(self, usernames: set) -> None:
+        missing = usernames - self.user_ids.keys()
+        if missing:
+            self.user_ids.update(User.objects.filter(username__in=missing).values_list("username", "pk"))
+
+    def validate_chunk(self, chunk: list) -> tuple:
+        """
+        Returns the clean rows as tuples in staging table column order, and (line number, error) pairs.
+        """
+        self.resolve_users({str(row.get("username", "")).strip() for _, row in chunk if isinstance(row, dict)})
+        rows, errors = [], []
+
+        for line_no, row in chunk:
+            if not isinstance(row, dict):
+                errors.append((line_no, "Invalid row"))
+                continue
+
+            row = {
+                key: "" if row.get(key) is None else TimesheetExportService.unescape_cell(str(row.get(key)).strip())
+                for key in self.FIELDS
+            }
+            if any("\x00" in value for value in row.values()):
+                errors.append((line_no, "Values can't contain NUL characters"))
+                continue
+            too_long = [key for key, max_length in self.MAX_LENGTHS.items() if len(row[key]) > max_length]
+            if too_long:
+                errors.append((line_no, ", ".join(
+                    f"{key} is longer than {self.MAX_LENGTHS[key]} characters" for key in too_long
+                )))
+                continue
+
+            username = row["username"]
+            try:
+                date_created = parse_date(row["date"]) if row["date"] else None
+            except ValueError:
+                # Well formed but not a real day, e.g. 2024-02-30
+                errors.append((line_no, f"Invalid date '{row['date']}'"))
+                continue
+
+            if self.allowed_usernames is not None and username not in self.allowed_usernames:
+                errors.append((line_no, f"You may not import entries for '{username}'"))
+                continue
+            if username not in self.user_ids:
+                errors.append((line_no, f"Unknown user '{username}'"))
+                continue
+            if not date_created:
+                errors.append((line_no, "A date in the YYYY-MM-DD format is required"))
+                continue
+
+            has_jira = bool(row["jira_issue_number"])
+            has_rise = bool(row["rise_value"] or row["rise_assignment_id"])
+            if not has_jira and not has_rise:
+                errors.append((line_no, "Row has neither a Jira issue nor a Rise entry"))
+                continue
+
+            minutes_spent = None
+            if has_jira:
+                # isdigit() alone accepts digits int() can't parse, e.g. "²"
+                minutes = row["minutes_spent"]
+                if not (minutes.isascii() and minutes.isdigit()) or not row["description"]:
+                    errors.append((line_no, "Jira rows need whole minutes_spent and a description"))
+                    continue
+                minutes_spent = int(minutes)
+                if minutes_spent > self.MAX_MINUTES:
+                    errors.append((line_no, f"Invalid minutes_spent '{minutes}', expected at most {self.MAX_MINUTES}"))
+                    continue
+
+            rise_hours, rise_log_type = None, None
+            if has_rise:
+                try:
+                    rise_hours = Decimal(row["rise_hours"] or "8.00")
+                except InvalidOperation:
+                    rise_hours = None
+
+                # hours_worked is numeric(4, 2), the database would round anything finer
+                if rise_hours is None or not rise_hours.is_finite() or not (0 <= rise_hours < 100) \
+                        or rise_hours != round(rise_hours, 2):
+                    errors.append((line_no, f"Invalid rise_hours '{row['rise_hours']}', expected hours below 100 with at most two decimals"))
+                    continue
+
+                rise_log_type = row["rise_log_type"] or RiseEntry.ASSIGNMENT
+                if not row["rise_assignment_id"] or rise_log_type not in (RiseEntry.ASSIGNMENT, RiseEntry.PROJECT):
+                    errors.append((line_no, "Rise rows need a rise_assignment_id and a valid rise_log_type"))
+                    continue
+
+            rows.append((
+                line_no, self.user_ids[username], date_created,
+                row["jira_issue_number"] or None, minutes_spent, row["description"] if has_jira else None,
+                row["rise_value"] if has_rise else None, rise_hours, row["rise_assignment_id"] or None, rise_log_type,
+            ))
+
+        if self.validate_issues:
+            rows = self.check_issue_keys(rows, errors)
+
+        return rows, errors
+
+    @staticmethod
+    def check_issue_keys(rows: list, errors: list) -> list:
+        """
+        Drop the rows whose Jira issue doesn't exist, adding an error for each. One search per user and 100 keys.
+        """
+        keys_by_user = {}
+        for row in rows:
+            if row[3]:
+                keys_by_user.setdefault(row[1], set()).add(row[3])
+
+        unknown = set()
+        jira_service = JiraService()
+        for user in User.objects.filter(pk__in=keys_by_user):
+            unknown.update(
+                (user.pk, issue_key) for issue_key in jira_service.get_unknown_issue_keys(user, keys_by_user[user.pk])
+            )
+
+        clean_rows = []
+        for row in rows:
+            if row[3] and (row[1], JiraApiClient.normalize_issue_key(row[3])) in unknown:
+                errors.append((row[0], f"Jira issue '{row[3]}' does not exist"))
+            else:
+                clean_rows.append(row)
+
+        return clean_rows
+
+    def run(self, file, file_format: str, sync: bool = False) -> dict:
+        """
+        Import the file in one transaction. With sync, every unsynced row in the imported users' date range is queued
+        in the outbox at the end. Returns the number of imported rows, the errors and the number queued.
+        """
+        results = {"imported": 0, "errors": [], "queued": 0}
+        user_ids, date_from, date_to = set(), None, None
+        postgres = connection.vendor == "postgresql"
+        rows = self.read_rows(file, file_format)
+
+        with transaction.atomic():
+            if postgres:
+                self.create_staging_table()
+
+            while chunk := list(islice(rows, self.chunk_size)):
+                clean_rows, errors = self.validate_chunk(chunk)
+                results["errors"].extend(errors)
+                if not clean_rows:
+                    continue
+
+                results["imported"] += len(clean_rows)
+                user_ids.update(row[1] for row in clean_rows)
+                dates = [row[2] for row in clean_rows]
+                date_from = min(dates + ([date_from] if date_from else []))
+                date_to = max(dates + ([date_to] if date_to else []))
+
+                if postgres:
+                    self.copy_to_staging(clean_rows)
+                else:
+                    self.load_chunk(clean_rows)
+
+            if postgres:
+                self.merge_staging()
+
+            if user_ids:
+                RollupService().rebuild(user_ids=list(user_ids), date_from=date_from, date_to=date_to)
+
+            if sync and user_ids:
+                for integration in registry:
+                    results["queued"] += OutboxService.enqueue_sync_queryset(integration.get_unsynced().filter(
+                        entry__user_id__in=user_ids,
+                        entry__date_created__gte=date_from,
+                        entry__date_created__lte=date_to,
+                    ))
+
+        return results
+
+    @staticmethod
+    def create_staging_table() -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TEMPORARY TABLE timesheet_import_staging (
+                    line_no integer,
+                    user_id bigint,
+                    date_created date,
+                    jira_issue_number varchar(255),
+                    minutes_spent integer,
+                    description text,
+                    rise_value text,
+                    rise_hours numeric(4, 2),
+                    rise_assignment_id varchar(20),
+                    rise_log_type varchar(200)
+                ) ON COMMIT DROP
+            """)
+
+    @staticmethod
+    def copy_to_staging(rows: list) -> None:
+        # Every value is quoted so no input can pass for the NULL marker, FORCE_NULL turns the quoted empty values
+        # back into NULLs. The only value that may legitimately be empty is rise_value, merged with COALESCE(.., '').
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in row])
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                "COPY timesheet_import_staging FROM STDIN WITH (FORMAT csv, NULL '', FORCE_NULL ("
+                "jira_issue_number, minutes_spent, description, rise_value, rise_hours, rise_assignment_id, "
+                "rise_log_type))",
+                buffer,
+            )
+
+    @staticmethod
+    def merge_staging() -> None:
+        entry_table = Entry._meta.db_table
+        jira_table = JiraEntry._meta.db_table
+        rise_table = RiseEntry._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {entry_table} (user_id, date_created)
+                SELECT DISTINCT user_id, date_created FROM timesheet_import_staging
+                ON CONFLICT (user_id, date_created) DO NOTHING
+            """)
+
+            # Changed rows lose last_synced_at so they are picked up as unsynced
+            cursor.execute(f"""
+                INSERT INTO {jira_table} (entry_id, jira_issue_number, minutes_spent, description, jira_entry_id, last_synced_at, payload_hash)
+                SELECT DISTINCT ON (e.id, s.jira_issue_number) e.id, s.jira_issue_number, s.minutes_spent, s.description, '', NULL, ''
+                FROM timesheet_import_staging s
+                JOIN {entry_table} e ON e.user_id = s.user_id AND e.date_created = s.date_created
+                WHERE s.jira_issue_number IS NOT NULL
+                ORDER BY e.id, s.jira_issue_number, s.line_no DESC
+                ON CONFLICT (entry_id, jira_issue_number) DO UPDATE SET
+                    minutes_spent = EXCLUDED.minutes_spent,
+                    description = EXCLUDED.description,
+                    last_synced_at = CASE
+                        WHEN ({jira_table}.minutes_spent, {jira_table}.description) IS DISTINCT FROM (EXCLUDED.minutes_spent, EXCLUDED.description)
+                        THEN NULL ELSE {jira_table}.last_synced_at
+                    END
+            """)
+
+            cursor.execute(f"""
+                INSERT INTO {rise_table} (entry_id, value, hours_worked, rise_entry_id, rise_assignment_id, rise_assignment_name, last_synced_at, log_type, payload_hash)
+                SELECT DISTINCT ON (e.id) e.id, COALESCE(s.rise_value, ''), s.rise_hours, '', s.rise_assignment_id, '', NULL, s.rise_log_type, ''
+                FROM timesheet_import_staging s
+                JOIN {entry_table} e ON e.user_id = s.user_id AND e.date_created = s.date_created
+                WHERE s.rise_assignment_id IS NOT NULL
+                ORDER BY e.id, s.line_no DESC
+                ON CONFLICT (entry_id) DO UPDATE SET
+                    value = EXCLUDED.value,
+                    hours_worked = EXCLUDED.hours_worked,
+                    rise_assignment_id = EXCLUDED.rise_assignment_id,
+                    log_type = EXCLUDED.log_type,
+                    last_synced_at = CASE
+                        WHEN ({rise_table}.value, {rise_table}.hours_worked) IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.hours_worked)
+                        THEN NULL ELSE {rise_table}.last_synced_at
+                    END
+            """)
+
+            # ON COMMIT DROP only fires on the outermost commit, drop it now in case run() is inside a transaction
+            cursor.execute("DROP TABLE timesheet_import_staging")
+
+    @staticmethod
+    def load_chunk(rows: list) -> None:
+        # Fallback for databases without COPY, the same merge done with bulk_create
+        Entry.objects.bulk_create(
+            [Entry(user_id=user_id, date_created=date_created) for user_id, date_created in {row[1:3] for row in rows}],
+            ignore_conflicts=True,
+        )
+        entry_ids = {}
+        for user_id in {row[1] for row in rows}:
+            dates = {row[2] for row in rows if row[1] == user_id}
+            entry_ids.update(
+                ((user_id, date_created), pk) for date_created, pk in
+                Entry.objects.filter(user_id=user_id, date_created__in=dates).values_list("date_created", "pk")
+            )
+
+        # Later rows win, the dict keeps the last one per key
+        jira_entries, rise_entries = {}, {}
+        for line_no, user_id, date_created, issue, minutes, description, value, hours, assignment_id, log_type in rows:
+            entry_id = entry_ids[(user_id, date_created)]
+            if issue:
+                jira_entries[(entry_id, issue)] = JiraEntry(
+                    entry_id=entry_id, jira_issue_number=issue, minutes_spent=minutes, description=description,
+                )
+            if assignment_id:
+                rise_entries[entry_id] = RiseEntry(
+                    entry_id=entry_id, value=value or "", hours_worked=hours, rise_assignment_id=assignment_id,
+                    log_type=log_type,
+                )
+
+        # Like merge_staging(), only rows whose synced values change lose last_synced_at
+        for entry_id, issue, minutes, description, last_synced_at in JiraEntry.objects.filter(
+            entry_id__in={key[0] for key in jira_entries}
+        ).values_list("entry_id", "jira_issue_number", "minutes_spent", "description", "last_synced_at"):
+            jira_entry = jira_entries.get((entry_id, issue))
+            if jira_entry and (jira_entry.minutes_spent, jira_entry.description) == (minutes, description):
+                jira_entry.last_synced_at = last_synced_at
+
+        for entry_id, value, hours, last_synced_at in RiseEntry.objects.filter(entry_id__in=rise_entries).values_list(
+            "entry_id", "value", "hours_worked", "last_synced_at"
+        ):
+            if (rise_entries[entry_id].value, rise_entries[entry_id].hours_worked) == (value, hours):
+                rise_entries[entry_id].last_synced_at = last_synced_at
+
+        JiraEntry.objects.bulk_create(
+            jira_entries.values(),
+            update_conflicts=True,
+            unique_fields=["entry", "jira_issue_number"],
+            update_fields=["minutes_spent", "description", "last_synced_at"],
+        )
+        RiseEntry.objects.bulk_create(
+            rise_entries.values(),
+            update_conflicts=True,
+            unique_fields=["entry"],
+            update_fields=["value", "hours_worked", "rise_assignment_id", "log_type", "last_synced_at"],
+        )
+
+
+class TimesheetExportService:
+    """
+    Streams entries as CSV, one row per Jira worklog (or one per day without worklogs) with that day's Rise entry.
+    Rows come from a server-side cursor over a flat join, so memory use doesn't grow with the export.
+    """
+
+    COLUMNS = [
+        ("user__username", "username"),
+        ("date_created", "date"),
+        ("jiraentry__jira_issue_number", "jira_issue_number"),
+        ("jiraentry__minutes_spent", "minutes_spent"),
+        ("jiraentry__description", "description"),
+        ("jiraentry__jira_entry_id", "jira_entry_id"),
+        ("jiraentry__last_synced_at", "jira_last_synced_at"),
+        ("riseentry__value", "rise_value"),
+        ("riseentry__hours_worked", "rise_hours"),
+        ("riseentry__rise_assignment_id", "rise_assignment_id"),
+        ("riseentry__rise_assignment_name", "rise_assignment_name"),
+        ("riseentry__log_type", "rise_log_type"),
+        ("riseentry__rise_entry_id", "rise_entry_id"),
+        ("riseentry__last_synced_at", "rise_last_synced_at"),
+    ]
+
+    # Cells starting with one of these run as formulas in spreadsheet apps
+    FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+    class Echo:
+        # csv.writer target that hands each line straight back instead of buffering it
+        def write(self, value):
+            return value
+
+    def __init__(self, chunk_size: int = 2000) -> None:
+        self.chunk_size = chunk_size
+
+    def get_rows(self, queryset):
+        # Re-select by primary key so annotations, ordering and grouping of the admin queryset don't leak in
+        return Entry.objects.filter(pk__in=queryset.values("pk")).order_by(
+            "user__username", "date_created", "jiraentry__jira_issue_number"
+        ).values_list(*[lookup for lookup, _ in self.COLUMNS]).iterator(chunk_size=self.chunk_size)
+
+    def stream_csv(self, queryset):
+        writer = csv.writer(self.Echo())
+        yield writer.writerow([header for _, header in self.COLUMNS])
+
+        for row in self.get_rows(queryset):
+            yield writer.writerow([self.escape_cell(value) for value in row])
+
+    @classmethod
+    def escape_cell(cls, value):
+        if value is None:
+            return ""
+
+        # Descriptions and issue keys are user input, quote anything a spreadsheet would evaluate
+        if isinstance(value, str) and value.startswith(cls.FORMULA_PREFIXES):
+            return f"'{value}"
+        return value
+
+    @classmethod
+    def unescape_cell(cls, value: str) -> str:
+        # Undo escape_cell(), so exported files import unchanged
+        if value.startswith("'") and value[1:].startswith(cls.FORMULA_PREFIXES):
+            return value[1:]
+        return value
+
+
+class RollupService:
+    """
+    Maintains TimesheetRollup rows. The handlers in entries.signals add the change of every saved or deleted row to
+    its week and month inside the same transaction, rebuild() recomputes periods from the rows for bulk writes and
+    repairs (see the rebuild_rollups command).
+    """
+
+    PERIODS = {
+        TimesheetRollup.WEEK: TruncWeek,
+        TimesheetRollup.MONTH: TruncMonth,
+    }
+
+    @staticmethod
+    def get_period_bounds(period_type: str, day) -> tuple:
+        if period_type == TimesheetRollup.WEEK:
+            start = day - timezone.timedelta(days=day.weekday())
+            return start, start + timezone.timedelta(days=6)
+
+        start = day.replace(day=1)
+        return start, (start + timezone.timedelta(days=32)).replace(day=1) - timezone.timedelta(days=1)
+
+    @classmethod
+    def apply_delta(cls, user_id: int, day, **delta) -> None:
+        """
+        Add delta (amounts per rollup field, e.g. jira_minutes=-30) to the user's week and month containing day, with
+        one UPDATE. A period without a rollup row yet is rebuilt from the rows instead, they include the change.
+        """
+        delta = {field: value for field, value in delta.items() if value}
+        if not user_id or not day or not delta:
+            return
+
+        periods = {period_type: cls.get_period_bounds(period_type, day)[0] for period_type in cls.PERIODS}
+        rollups = TimesheetRollup.objects.filter(user_id=user_id).filter(
+            reduce(or_, (Q(period_type=period_type, period_start=start) for period_type, start in periods.items()))
+        )
+
+        # Clamped at zero so a rollup that drifted can't fail the save, rebuild_rollups repairs it
+        updated = rollups.update(updated_at=timezone.now(), **{
+            field: Greatest(F(field) + value, Value(0), output_field=TimesheetRollup._meta.get_field(field))
+            for field, value in delta.items()
+        })
+
+        if updated < len(periods):
+            for period_type in periods.keys() - set(rollups.values_list("period_type", flat=True)):
+                cls().rebuild(user_ids=[user_id], date_from=day, date_to=day, period_types=[period_type])
+        elif delta.get("entry_count", 0) < 0:
+            # The period's last entry is gone
+            rollups.filter(entry_count=0).delete()
+
+    @classmethod
+    def rebuild_days(cls, days: set) -> None:
+        """
+        Rebuild the weeks and months containing the (user_id, day) pairs, for rows written without signals. Every
+        period is rebuilt once for all users with a change in it.
+        """
+        user_ids_by_period = {}
+        for user_id, day in days:
+            for period_type in cls.PERIODS:
+                period_start = cls.get_period_bounds(period_type, day)[0]
+                user_ids_by_period.setdefault((period_type, period_start), set()).add(user_id)
+
+        for (period_type, period_start), user_ids in sorted(user_ids_by_period.items()):
+            cls().rebuild(
+                user_ids=sorted(user_ids), date_from=period_start, date_to=period_start, period_types=[period_type]
+            )
+
+    def rebuild(self, user_ids: list = None, date_from=None, date_to=None, period_types: list = None) -> int:
+        """
+        Recompute the rollups of the given users (or everyone) for every period of period_types (or all types)
+        overlapping the date range (or all time). Returns the number of rollup rows written.
+        """
+        written = 0
+
+        for period_type, trunc in self.PERIODS.items():
+            if period_types is not None and period_type not in period_types:
+                continue
+
+            entries = Entry.objects.all()
+            rollups = TimesheetRollup.objects.filter(period_type=period_type)
+
+            if user_ids is not None:
+                entries = entries.filter(user_id__in=user_ids)
+                rollups = rollups.filter(user_id__in=user_ids)
+            if date_from:
+                period_start = self.get_period_bounds(period_type, date_from)[0]
+                entries = entries.filter(date_created__gte=period_start)
+                rollups = rollups.filter(period_start__gte=period_start)
+            if date_to:
+                period_end = self.get_period_bounds(period_type, date_to)[1]
+                entries = entries.filter(date_created__lte=period_end)
+                rollups = rollups.filter(period_start__lte=period_end)
+
+            totals = {}
+
+            def get_rollup(user_id, period_start):
+                key = (user_id, period_start)
+                if key not in totals:
+                    totals[key] = TimesheetRollup(user_id=user_id, period_type=period_type, period_start=period_start)
+                return totals[key]
+
+            for user_id, period_start, entry_count in entries.annotate(period=trunc("date_created")) \
+                    .values("user_id", "period").annotate(count=Count("id")).values_list("user_id", "period", "count"):
+                get_rollup(user_id, period_start).entry_count = entry_count
+
+            jira_entries = JiraEntry.objects.filter(entry__in=entries).annotate(period=trunc("entry__date_created"))
+            for user_id, period_start, minutes, count in jira_entries.values("entry__user_id", "period").annotate(
+                minutes=Sum("minutes_spent"), count=Count("id")
+            ).values_list("entry__user_id", "period", "minutes", "count"):
+                rollup = get_rollup(user_id, period_start)
+                rollup.jira_minutes, rollup.jira_entry_count = minutes or 0, count
+
+            rise_entries = RiseEntry.objects.filter(entry__in=entries).annotate(period=trunc("entry__date_created"))
+            for user_id, period_start, hours in rise_entries.values("entry__user_id", "period").annotate(
+                hours=Sum("hours_worked")
+            ).values_list("entry__user_id", "period", "hours"):
+                get_rollup(user_id, period_start).rise_hours = hours or 0
+
+            with transaction.atomic():
+                TimesheetRollup.objects.bulk_create(
+                    totals.values(),
+                    update_conflicts=True,
+                    unique_fields=["user", "period_type", "period_start"],
+                    update_fields=["jira_minutes", "rise_hours", "entry_count", "jira_entry_count", "updated_at"],
+                )
+
+                # Periods in range that no longer have any entries
+                stale = [
+                    pk for pk, user_id, period_start in rollups.values_list("pk", "user_id", "period_start")
+                    if (user_id, period_start) not in totals
+                ]
+                TimesheetRollup.objects.filter(pk__in=stale).delete()
+
+            written += len(totals)
+
+        transaction.on_commit(lambda: DashboardService.clear_cache(user_ids=user_ids))
+
+        return written
+
+
+# Per process, so other workers may show stale widgets until the TTL expires
+dashboard_cache = TTLCache(maxsize=settings.DASHBOARD_CACHE_SIZE, ttl=settings.DASHBOARD_CACHE_TTL)
+
+
+class DashboardService:
+    """
+    Aggregates shown on the admin index for a single user. Every widget is cached for a short while and dropped when
+    the user's entries change.
+    """
+
+    TOP_ISSUES_LIMIT = 5
+
+    def __init__(self, user: User):
+        self.user = user
+        self.today = timezone.localdate()
+
+    def get_cached(self, widget: str, func):
+        key = (self.user.pk, widget)
+        value = dashboard_cache.get(key)
+        if value is None:
+            value = func()
+            dashboard_cache.set(key, value)
+
+        return value
+
+    @staticmethod
+    def clear_cache(user_ids: list = None) -> None:
+        if user_ids is None:
+            dashboard_cache.clear()
+        else:
+            dashboard_cache.discard_where(lambda key: key[0] in user_ids)
+
+    def get_hours(self) -> dict:
+        def query():
+            periods = {
+                period_type: RollupService.get_period_bounds(period_type, self.today)[0]
+                for period_type in RollupService.PERIODS
+            }
+            hours = {period_type: {"jira": 0, "rise": 0} for period_type in periods}
+            for rollup in TimesheetRollup.objects.filter(user=self.user, period_start__in=set(periods.values())):
+                if periods[rollup.period_type] == rollup.period_start:
+                    hours[rollup.period_type] = {"jira": rollup.jira_hours, "rise": rollup.rise_hours}
+            return hours
 
-    def update_entry(self, jira_entry: JiraEntry) -> None:
-        jira_client = self.get_client(user=jira_entry.entry.user)
-        jira_client.update_entry(jira_entry=jira_entry)
+        return self.get_cached("hours", query)
 
-    def delete_entry(self, jira_entry: JiraEntry) -> None:
-        jira_client = self.get_client(user=jira_entry.entry.user)
-        jira_client.delete_entry(jira_entry=jira_entry)
+    def get_unsynced_counts(self) -> dict:
+        return self.get_cached("unsynced", lambda: {
+            integration.label: integration.get_unsynced().filter(entry__user=self.user).count()
+            for integration in registry
+        })
 
-    def create_entry(self, jira_entry: JiraEntry) -> None:
-        jira_client = self.get_client(user=jira_entry.entry.user)
-        jira_client.create_entry(jira_entry=jira_entry)
+    def get_top_jira_issues(self) -> list:
+        month_start = RollupService.get_period_bounds(TimesheetRollup.MONTH, self.today)[0]
 
+        return self.get_cached("top_jira_issues", lambda: [
+            (issue_number, round(minutes / 60, 2))
+            for issue_number, minutes in JiraEntry.objects.filter(
+                entry__user=self.user, entry__date_created__gte=month_start
+            ).values("jira_issue_number").annotate(minutes=Sum("minutes_spent")).order_by("-minutes")
+            .values_list("jira_issue_number", "minutes")[:self.TOP_ISSUES_LIMIT]
+        ])
@@ -0,0 +1,124 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from entries.models import Entry, JiraEntry, RiseEntry
+from entries.services import DashboardService, RollupService
+
+# Saves that only record sync state don't change any totals
+SYNC_ONLY_FIELDS = {"jira_entry_id", "rise_entry_id", "last_synced_at", "payload_hash"}
+
+# The fields whose stored values the rollups depend on, remembered when a row is loaded
+ROLLUP_SOURCE_FIELDS = {
+    Entry: ("user_id", "date_created"),
+    JiraEntry: ("entry_id", "minutes_spent"),
+    RiseEntry: ("entry_id", "hours_worked"),
+}
+
+
+def clear_dashboard(user_id):
+    # After commit (and after the rollups are refreshed) so a concurrent request can't cache the old values again
+    transaction.on_commit(lambda: DashboardService.clear_cache(user_ids=[user_id]))
+
+
+def get_line_delta(sender, value, count: int) -> dict:
+    # Rollup field changes for adding (count=1) or removing (count=-1) a worklog or timesheet line
+    if sender is JiraEntry:
+        return {"jira_minutes": int(value) * count, "jira_entry_count": count}
+    return {"rise_hours": Decimal(str(value)) * count}
+
+
+@receiver(post_init, sender=Entry)
+@receiver(post_init, sender=JiraEntry)
+@receiver(post_init, sender=RiseEntry)
+def remember_rollup_values(sender, instance, **kwargs):
+    # Read from __dict__ so deferred fields aren't loaded
+    instance._rollup_values = tuple(instance.__dict__.get(field) for field in ROLLUP_SOURCE_FIELDS[sender])
+
+
+@receiver(pre_save, sender=Entry)
+@receiver(pre_save, sender=JiraEntry)
+@receiver(pre_save, sender=RiseEntry)
+@receiver(pre_delete, sender=Entry)
+@receiver(pre_delete, sender=JiraEntry)
+@receiver(pre_delete, sender=RiseEntry)
+def load_rollup_values(sender, instance, update_fields=None, **kwargs):
+    # A row loaded with a field deferred, or built with the pk of an existing row, doesn't know what the rollups hold,
+    # read it before it's overwritten
+    if instance.pk is None or (not instance._state.adding and None not in instance._rollup_values):
+        return
+    if update_fields and set(update_fields) <= SYNC_ONLY_FIELDS:
+        return
+
+    instance._rollup_values = sender.objects.filter(pk=instance.pk).values_list(
+        *ROLLUP_SOURCE_FIELDS[sender]
+    ).first() or (None, None)
+
+
+@receiver(post_save, sender=Entry)
+def entry_saved(sender, instance, created, **kwargs):
+    clear_dashboard(instance.user_id)
+    day = (instance.user_id, instance.date_created)
+    previous_day = (None, None) if created else instance._rollup_values
+    instance._rollup_values = day
+
+    if created:
+        RollupService.apply_delta(*day, entry_count=1)
+    elif all(previous_day) and previous_day != day:
+        # Moving an entry to another day moves its lines' totals along
+        jira = JiraEntry.objects.filter(entry=instance).aggregate(minutes=Sum("minutes_spent"), count=Count("id"))
+        hours = RiseEntry.objects.filter(entry=instance).aggregate(hours=Sum("hours_worked"))["hours"] or 0
+        totals = {"entry_count": 1, "jira_minutes": jira["minutes"] or 0, "jira_entry_count": jira["count"],
+                  "rise_hours": hours}
+        RollupService.apply_delta(*previous_day, **{field: -value for field, value in totals.items()})
+        RollupService.apply_delta(*day, **totals)
+
+
+@receiver(post_delete, sender=Entry)
+def entry_deleted(sender, instance, **kwargs):
+    clear_dashboard(instance.user_id)
+    RollupService.apply_delta(instance.user_id, instance.date_created, entry_count=-1)
+
+
+@receiver(post_save, sender=JiraEntry)
+@receiver(post_save, sender=RiseEntry)
+def entry_line_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Sync state changes the unsynced counts on the dashboard
+    clear_dashboard(instance.entry.user_id)
+
+    if update_fields and set(update_fields) <= SYNC_ONLY_FIELDS:
+        return
+
+    value = getattr(instance, ROLLUP_SOURCE_FIELDS[sender][1])
+    previous_entry_id, previous_value = (None, None) if created else instance._rollup_values
+    instance._rollup_values = (instance.entry_id, value)
+
+    if previous_entry_id == instance.entry_id:
+        delta = get_line_delta(sender, value, 1)
+        for field, amount in get_line_delta(sender, previous_value, -1).items():
+            delta[field] += amount
+        RollupService.apply_delta(instance.entry.user_id, instance.entry.date_created, **delta)
+        return
+
+    if previous_entry_id:
+        # Moved to another day's entry
+        previous_day = Entry.objects.values_list("user_id", "date_created").get(pk=previous_entry_id)
+        RollupService.apply_delta(*previous_day, **get_line_delta(sender, previous_value, -1))
+    RollupService.apply_delta(
+        instance.entry.user_id, instance.entry.date_created, **get_line_delta(sender, value, 1)
+    )
+
+
+@receiver(post_delete, sender=JiraEntry)
+@receiver(post_delete, sender=RiseEntry)
+def entry_line_deleted(sender, instance, **kwargs):
+    clear_dashboard(instance.entry.user_id)
+
+    entry_id, value = instance._rollup_values
+    if entry_id:
+        RollupService.apply_delta(
+            instance.entry.user_id, instance.entry.date_created, **get_line_delta(sender, value, -1)
+        )
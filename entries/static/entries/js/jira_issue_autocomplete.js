@@ -0,0 +1,56 @@
+// Suggests Jira issues in the worklog inline's issue field. Inputs opt in with a data-jira-issues-url attribute and
+// get a <datalist> filled from EntryAdmin.jira_issues_view while the user types.
+(function () {
+    "use strict";
+
+    const DELAY = 250;
+    const MIN_LENGTH = 2;
+    const timers = new WeakMap();
+
+    function getDatalist(input) {
+        if (input.list) {
+            return input.list;
+        }
+
+        const datalist = document.createElement("datalist");
+        datalist.id = `${input.id}-issues`;
+        input.setAttribute("list", datalist.id);
+        input.after(datalist);
+        return datalist;
+    }
+
+    function suggest(input) {
+        const term = input.value.trim();
+        if (term.length < MIN_LENGTH) {
+            return;
+        }
+
+        fetch(`${input.dataset.jiraIssuesUrl}?term=${encodeURIComponent(term)}`, {credentials: "same-origin"})
+            .then((response) => response.ok ? response.json() : {results: []})
+            .then((data) => {
+                // Ignore answers for a term the user has typed past
+                if (input.value.trim() !== term) {
+                    return;
+                }
+
+                getDatalist(input).replaceChildren(...data.results.map((result) => {
+                    const option = document.createElement("option");
+                    option.value = result.id;
+                    option.label = result.text;
+                    return option;
+                }));
+            })
+            .catch(() => {});
+    }
+
+    // Delegated, so rows added with "Add another" are covered too
+    document.addEventListener("input", (event) => {
+        const input = event.target;
+        if (!(input instanceof HTMLInputElement) || !input.dataset.jiraIssuesUrl) {
+            return;
+        }
+
+        clearTimeout(timers.get(input));
+        timers.set(input, setTimeout(() => suggest(input), DELAY));
+    });
+})();
@@ -1,3 +1,713 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from cryptography.fernet import Fernet
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from api_clients.jira import JiraApiClient, issue_cache, issue_search_cache
+from api_clients.ratelimit import RateLimited, RateLimiter
+from api_clients.rise import RiseApiClient
+from entries.admin import JiraEntryForm
+from entries.models import Entry, IntegrationCallLog, JiraEntry, RiseEntry, SyncOutbox, TimesheetRollup
+from entries.services import OutboxService, RollupService, TimesheetExportService, TimesheetImportService
+from lib.cache import TTLCache
+from lib.utils import FernetCipher
+from users.models import User
+
+TEST_ENCRYPTION_KEY = Fernet.generate_key().decode()
+
+
+def create_user(username: str) -> User:
+    # Call with ENCRYPTION_KEY overridden, the credentials are stored encrypted
+    cipher = FernetCipher()
+    return User.objects.create_user(
+        username=username,
+        rise_api_key=cipher.encrypt_value("rise-key"),
+        rise_user_id=1,
+        jira_api_key=cipher.encrypt_value("jira-key"),
+        jira_email_address=f"{username}@example.com",
+        jira_url="https://jira.example.com",
+    )
+
+
+def create_jira_entry(user: User, **kwargs) -> JiraEntry:
+    entry, _ = Entry.objects.get_or_create(user=user, date_created=kwargs.pop("date_created", timezone.localdate()))
+    fields = {"jira_issue_number": "ABC-1", "minutes_spent": 30, "description": "Work", **kwargs}
+    return JiraEntry.objects.select_related("entry__user").get(pk=JiraEntry.objects.create(entry=entry, **fields).pk)
+
+
+def get_response(status_code: int = 200, data: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(data or {}).encode()
+    response.request = requests.PreparedRequest()
+    return response
+
+
+class BenchmarkAdminCommandTests(TransactionTestCase):
+
+    @mock.patch("entries.management.commands.benchmark_admin.teardown_test_environment")
+    @mock.patch("entries.management.commands.benchmark_admin.setup_test_environment")
+    def test_every_scenario_runs(self, setup_test_environment, teardown_test_environment):
+        # The test runner already provides the throwaway database the command would create
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(connection.creation, "create_test_db"), \
+                mock.patch.object(connection.creation, "destroy_test_db"):
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark_admin", iterations=1, latency=0, days=2, worklogs=1, output=output, stdout=io.StringIO()
+            )
+            with open(output) as file:
+                scenarios = json.load(file)["scenarios"]
+
+        self.assertEqual({name: result["errors"] for name, result in scenarios.items() if result["errors"]}, {})
+        self.assertGreater(scenarios["outbox_drain"]["outbound_calls"]["per_iteration"], 0)
+        self.assertGreater(scenarios["change_view"]["queries"]["max"], 0)
+
+
+class TTLCacheTests(SimpleTestCase):
+
+    @mock.patch("lib.cache.time.monotonic")
+    def test_expired_keys_are_missing(self, monotonic):
+        monotonic.return_value = 100
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("key", "value")
+        cache.set("short", "value", ttl=5)
+
+        monotonic.return_value = 110
+        self.assertEqual(cache.get("key"), "value")
+        self.assertIsNone(cache.get("short"))
+
+        monotonic.return_value = 161
+        self.assertNotIn("key", cache)
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_key_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_discard_where(self):
+        cache = TTLCache()
+        cache.set((1, "hours"), 1)
+        cache.set((1, "unsynced"), 2)
+        cache.set((2, "hours"), 3)
+
+        cache.discard_where(lambda key: key[0] == 1)
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get((2, "hours")), 3)
+
+
+@mock.patch("api_clients.ratelimit.time.monotonic", return_value=1000.0)
+class RateLimiterTests(SimpleTestCase):
+    key = ("https://jira.example.com", 1)
+
+    def test_burst_then_wait_for_refill(self, monotonic):
+        limiter = RateLimiter(rate=2, burst=3, max_wait=60)
+
+        self.assertEqual([limiter.reserve(self.key) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(limiter.reserve(self.key), 0.5)
+        # Callers queue up behind the reserved tokens
+        self.assertEqual(limiter.reserve(self.key), 1.0)
+
+        monotonic.return_value = 1002.0
+        self.assertEqual(limiter.reserve(self.key), 0)
+
+    def test_keys_have_their_own_buckets(self, monotonic):
+        limiter = RateLimiter(rate=1, burst=1, max_wait=60)
+
+        self.assertEqual(limiter.reserve(self.key), 0)
+        self.assertEqual(limiter.reserve(("https://jira.example.com", 2)), 0)
+        self.assertEqual(limiter.reserve(self.key), 1.0)
+
+    def test_waits_longer_than_max_wait_raise(self, monotonic):
+        limiter = RateLimiter(rate=1, burst=1, max_wait=5)
+        limiter.reserve(self.key)
+        limiter.update_from_headers(self.key, 429, {"Retry-After": "30"})
+
+        with self.assertRaises(RateLimited) as context:
+            limiter.reserve(self.key)
+        self.assertEqual(context.exception.wait, 30)
+
+    def test_retry_after_blocks_the_key(self, monotonic):
+        limiter = RateLimiter(rate=10, burst=10, max_wait=60)
+
+        self.assertEqual(limiter.update_from_headers(self.key, 429, {"Retry-After": "3"}), 3)
+        self.assertEqual(limiter.reserve(self.key), 3)
+        # Only throttled responses are told to back off
+        self.assertEqual(limiter.update_from_headers(("other", 1), 200, {"Retry-After": "3"}), 0)
+
+    def test_throttled_without_hint_waits_one_token(self, monotonic):
+        limiter = RateLimiter(rate=4, burst=10, max_wait=60)
+
+        self.assertEqual(limiter.update_from_headers(self.key, 429, {}), 0.25)
+
+    def test_bucket_follows_advertised_limit(self, monotonic):
+        limiter = RateLimiter(rate=10, burst=10, max_wait=60)
+        limiter.update_from_headers(self.key, 200, {
+            "X-RateLimit-Limit": "100", "X-RateLimit-FillRate": "10", "X-RateLimit-Interval-Seconds": "2",
+        })
+
+        bucket = limiter.get_bucket(self.key)
+        self.assertEqual((bucket.capacity, bucket.rate), (100, 5))
+
+    def test_parse_retry_after(self, monotonic):
+        self.assertEqual(RateLimiter.parse_retry_after("12"), 12)
+        self.assertEqual(RateLimiter.parse_retry_after("-1"), 0)
+        self.assertIsNone(RateLimiter.parse_retry_after("soon"))
+        self.assertEqual(RateLimiter.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY, SYNC_OUTBOX_RETRY_BACKOFF=30, SYNC_OUTBOX_MAX_ATTEMPTS=3)
+class OutboxServiceTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user("outbox")
+        self.jira_entry = create_jira_entry(self.user)
+        self.message = OutboxService.enqueue_sync(self.jira_entry)
+
+    def test_successful_push_finishes_the_message(self):
+        with mock.patch("entries.integrations.JiraIntegration.push") as push:
+            self.assertEqual(OutboxService().process_batch(), 1)
+
+        push.assert_called_once()
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), (SyncOutbox.DONE, 1))
+        self.assertIsNotNone(self.message.processed_at)
+
+    def test_failed_push_is_retried_with_exponential_backoff(self):
+        with mock.patch("entries.integrations.JiraIntegration.push", side_effect=requests.ConnectionError("down")), \
+                self.assertLogs("entries.services", "WARNING") as logs:
+            for attempt, delay in ((1, 30), (2, 60)):
+                before = timezone.now()
+                OutboxService().process_batch()
+                self.message.refresh_from_db()
+
+                self.assertEqual((self.message.status, self.message.attempts), (SyncOutbox.PENDING, attempt))
+                self.assertEqual(self.message.last_error, "down")
+                self.assertGreaterEqual(self.message.available_at, before + timezone.timedelta(seconds=delay))
+                self.assertLess(self.message.available_at, before + timezone.timedelta(seconds=delay + 5))
+
+                # Not due yet
+                self.assertEqual(OutboxService().process_batch(), 0)
+                SyncOutbox.objects.update(available_at=timezone.now())
+
+            OutboxService().process_batch()
+
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), (SyncOutbox.FAILED, 3))
+        self.assertEqual(len(logs.output), 3)
+
+    def test_claimed_messages_are_leased(self):
+        claimed = OutboxService.claim(SyncOutbox.objects.all())
+        self.assertEqual([message.pk for message in claimed], [self.message.pk])
+        self.assertEqual(claimed[0].attempts, 1)
+
+        # A claimed message is neither picked up by a worker nor pushed again after a save
+        with mock.patch("entries.integrations.JiraIntegration.push") as push:
+            self.assertEqual(OutboxService().process_batch(), 0)
+            self.assertEqual(OutboxService().process_now([self.message.pk]), {"succeeded": [], "failed": []})
+        push.assert_not_called()
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class TimesheetImportServiceTests(TestCase):
+    header = "username,date,jira_issue_number,minutes_spent,description,rise_value,rise_hours,rise_assignment_id,rise_log_type\n"
+
+    def setUp(self):
+        self.user = create_user("importer")
+
+    def run_import(self, rows: str, sync: bool = False) -> dict:
+        return TimesheetImportService().run(io.BytesIO((self.header + rows).encode()), "csv", sync=sync)
+
+    def test_invalid_rows_are_reported_not_imported(self):
+        results = self.run_import(
+            "importer,2024-02-30,ABC-1,30,Work,,,,\n"
+            "importer,2024-02-01,,,,Work,8.125,11,\n"
+            "importer,2024-02-01,,,,Work,NaN,11,\n"
+            "importer,2024-02-01,ABC-1,half,Work,,,,\n"
+            "nobody,2024-02-01,ABC-1,30,Work,,,,\n"
+            "importer,,ABC-1,30,Work,,,,\n"
+            "importer,2024-02-01,,,,,,,\n"
+        )
+
+        self.assertEqual(results["imported"], 0)
+        self.assertEqual([line_no for line_no, _ in results["errors"]], [2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual(results["errors"][0][1], "Invalid date '2024-02-30'")
+        self.assertIn("at most two decimals", results["errors"][1][1])
+        self.assertFalse(Entry.objects.exists())
+
+    def test_rows_are_merged_later_rows_winning(self):
+        results = self.run_import(
+            "importer,2024-02-01,ABC-1,30,First,Day,7.5,11,\n"
+            "importer,2024-02-01,ABC-1,45,Second,,,,\n"
+            "importer,2024-02-01,ABC-2,15,Other,,,,\n"
+        )
+
+        self.assertEqual(results, {"imported": 3, "errors": [], "queued": 0})
+        self.assertEqual(Entry.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            sorted(JiraEntry.objects.values_list("jira_issue_number", "minutes_spent", "description")),
+            [("ABC-1", 45, "Second"), ("ABC-2", 15, "Other")],
+        )
+        self.assertEqual(RiseEntry.objects.get().hours_worked, 7.5)
+
+    def test_only_changed_rows_lose_their_sync_state(self):
+        self.run_import("importer,2024-02-01,ABC-1,30,Work,Day,7.5,11,\nimporter,2024-02-02,ABC-1,30,Work,Day,7.5,11,\n")
+        synced_at = timezone.now()
+        JiraEntry.objects.update(jira_entry_id="1", last_synced_at=synced_at)
+        RiseEntry.objects.update(rise_entry_id="1", last_synced_at=synced_at)
+
+        self.run_import("importer,2024-02-01,ABC-1,30,Work,Day,7.50,11,\nimporter,2024-02-02,ABC-1,60,Work,Day,8,11,\n")
+
+        self.assertEqual(
+            list(JiraEntry.objects.order_by("entry__date_created").values_list("minutes_spent", "last_synced_at")),
+            [(30, synced_at), (60, None)],
+        )
+        self.assertEqual(
+            list(RiseEntry.objects.order_by("entry__date_created").values_list("last_synced_at", flat=True)),
+            [synced_at, None],
+        )
+
+    def test_sync_queues_unsynced_rows(self):
+        results = self.run_import("importer,2024-02-01,ABC-1,30,Work,Day,7.5,11,\n", sync=True)
+
+        self.assertEqual(results["queued"], 2)
+        self.assertEqual(SyncOutbox.objects.filter(status=SyncOutbox.PENDING).count(), 2)
+
+    def test_values_the_columns_cant_hold_are_reported(self):
+        long_issue, long_assignment = "ABC-" + "1" * 252, "1" * 21
+        results = self.run_import(
+            f"importer,2024-02-01,{long_issue},30,Work,,,,\n"
+            f"importer,2024-02-01,,,,Day,8,{long_assignment},\n"
+            f"importer,2024-02-01,ABC-1,{2 ** 31},Work,,,,\n"
+            "importer,2024-02-01,ABC-1,²,Work,,,,\n"
+            "importer,2024-02-01,ABC-1,30,\"Nul\x00\",,,,\n"
+        )
+
+        self.assertEqual(results["imported"], 0)
+        self.assertEqual([error for _, error in results["errors"]], [
+            "jira_issue_number is longer than 255 characters",
+            "rise_assignment_id is longer than 20 characters",
+            f"Invalid minutes_spent '{2 ** 31}', expected at most {2 ** 31 - 1}",
+            "Jira rows need whole minutes_spent and a description",
+            "Values can't contain NUL characters",
+        ])
+
+    def test_values_like_a_null_marker_are_kept(self):
+        results = self.run_import(
+            "importer,2024-02-01,ABC-1,30,\\N,,,,\n"
+            "importer,2024-02-01,ABC-2,30,\"Two\nlines, \"\"quoted\"\"\",,8,11,\n"
+        )
+
+        self.assertEqual(results["errors"], [])
+        self.assertEqual(
+            dict(JiraEntry.objects.values_list("jira_issue_number", "description")),
+            {"ABC-1": "\\N", "ABC-2": 'Two\nlines, "quoted"'},
+        )
+        self.assertEqual(RiseEntry.objects.get().value, "")
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY and the staging table are PostgreSQL only")
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class TimesheetImportCopyTests(TestCase):
+    header = TimesheetImportServiceTests.header
+
+    def setUp(self):
+        self.user = create_user("importer")
+
+    def run_import(self, rows: str) -> dict:
+        with mock.patch.object(TimesheetImportService, "load_chunk") as load_chunk:
+            results = TimesheetImportService(chunk_size=2).run(io.BytesIO((self.header + rows).encode()), "csv")
+        load_chunk.assert_not_called()
+        return results
+
+    def get_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('timesheet_import_staging')")
+            return cursor.fetchone()[0]
+
+    def test_chunks_are_copied_and_merged(self):
+        results = self.run_import(
+            "importer,2024-02-01,ABC-1,30,First,Day,7.5,11,\n"
+            "importer,2024-02-01,ABC-1,45,Second,,,,\n"
+            "importer,2024-02-02,ABC-1,15,\\N,,8.25,12,project\n"
+        )
+
+        self.assertEqual(results, {"imported": 3, "errors": [], "queued": 0})
+        self.assertEqual(
+            sorted(JiraEntry.objects.values_list("entry__date_created", "minutes_spent", "description")),
+            [(timezone.datetime(2024, 2, 1).date(), 45, "Second"), (timezone.datetime(2024, 2, 2).date(), 15, "\\N")],
+        )
+        self.assertEqual(
+            sorted(RiseEntry.objects.values_list("value", "hours_worked", "rise_assignment_id", "log_type")),
+            [("", 8.25, "12", "project"), ("Day", 7.5, "11", "assignment")],
+        )
+        self.assertIsNone(self.get_staging_table())
+
+    def test_imports_inside_one_transaction(self):
+        # The test case's transaction stays open, so the staging table's ON COMMIT DROP never fires
+        self.run_import("importer,2024-02-01,ABC-1,30,Work,Day,7.5,11,\n")
+        JiraEntry.objects.update(jira_entry_id="1", last_synced_at=timezone.now())
+        RiseEntry.objects.update(rise_entry_id="1", last_synced_at=timezone.now())
+
+        self.run_import("importer,2024-02-01,ABC-1,30,Work,Day,8,11,\n")
+
+        self.assertIsNotNone(JiraEntry.objects.get().last_synced_at)
+        self.assertIsNone(RiseEntry.objects.get().last_synced_at)
+        self.assertIsNone(self.get_staging_table())
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class TimesheetExportServiceTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user("exporter")
+
+    def test_exported_formulas_import_unchanged(self):
+        create_jira_entry(self.user, description="=1+1")
+        create_jira_entry(self.user, jira_issue_number="ABC-2", description="-2 hours, see 'notes'")
+        export = "".join(TimesheetExportService().stream_csv(Entry.objects.all()))
+        self.assertIn(",'=1+1,", export)
+        self.assertIn(",'-2 hours, see 'notes',", export.replace('"', ""))
+
+        JiraEntry.objects.all().delete()
+        results = TimesheetImportService().run(io.BytesIO(export.encode()), "csv")
+
+        self.assertEqual(results["errors"], [])
+        self.assertEqual(
+            dict(JiraEntry.objects.values_list("jira_issue_number", "description")),
+            {"ABC-1": "=1+1", "ABC-2": "-2 hours, see 'notes'"},
+        )
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class RollupServiceTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user("rollups")
+        self.day = timezone.datetime(2024, 1, 31).date()
+
+    def get_rollups(self) -> list:
+        return list(TimesheetRollup.objects.order_by("period_type", "period_start").values_list(
+            "period_type", "period_start", "jira_minutes", "rise_hours", "entry_count", "jira_entry_count"
+        ))
+
+    def assertMatchesRebuild(self):
+        rollups = self.get_rollups()
+        RollupService().rebuild()
+        self.assertEqual(rollups, self.get_rollups())
+
+    def test_saves_and_deletes_update_the_rollups(self):
+        jira_entry = create_jira_entry(self.user, date_created=self.day)
+        other = create_jira_entry(self.user, date_created=self.day, jira_issue_number="ABC-2", minutes_spent=15)
+        rise_entry = RiseEntry.objects.create(entry=jira_entry.entry, value="Day", hours_worked=7.5)
+        self.assertEqual(self.get_rollups(), [
+            ("month", self.day.replace(day=1), 45, 7.5, 1, 2),
+            ("week", timezone.datetime(2024, 1, 29).date(), 45, 7.5, 1, 2),
+        ])
+
+        jira_entry.minutes_spent = 60
+        jira_entry.save()
+        rise_entry.hours_worked = 6
+        rise_entry.save()
+        other.delete()
+        self.assertEqual(self.get_rollups()[0], ("month", self.day.replace(day=1), 60, 6, 1, 1))
+        self.assertMatchesRebuild()
+
+        jira_entry.delete()
+        rise_entry.delete()
+        Entry.objects.get().delete()
+        self.assertEqual(self.get_rollups(), [])
+
+    def test_moved_rows_take_their_totals_along(self):
+        jira_entry = create_jira_entry(self.user, date_created=self.day)
+        RiseEntry.objects.create(entry=jira_entry.entry, value="Day", hours_worked=8)
+
+        # Into February and a new week
+        entry = Entry.objects.get()
+        entry.date_created = self.day + timezone.timedelta(days=5)
+        entry.save()
+        self.assertMatchesRebuild()
+        self.assertEqual([rollup[:2] for rollup in self.get_rollups()], [
+            ("month", timezone.datetime(2024, 2, 1).date()), ("week", timezone.datetime(2024, 2, 5).date()),
+        ])
+
+        # A worklog moved to another day's entry
+        other_entry = Entry.objects.create(user=self.user, date_created=self.day)
+        jira_entry = JiraEntry.objects.get()
+        jira_entry.entry = other_entry
+        jira_entry.save()
+        self.assertMatchesRebuild()
+
+    def test_deferred_and_sync_only_saves(self):
+        create_jira_entry(self.user, date_created=self.day)
+
+        jira_entry = JiraEntry.objects.select_related("entry").defer("minutes_spent").get()
+        jira_entry.minutes_spent = 90
+        jira_entry.save()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.get_rollups()[0][2], 90)
+
+        jira_entry.last_synced_at = timezone.now()
+        with self.assertNumQueries(1):
+            jira_entry.save(update_fields=["last_synced_at"])
+
+    def test_rolled_back_changes_leave_the_rollups(self):
+        jira_entry = create_jira_entry(self.user, date_created=self.day)
+        rollups = self.get_rollups()
+
+        try:
+            with transaction.atomic():
+                jira_entry.minutes_spent = 120
+                jira_entry.save()
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertEqual(self.get_rollups(), rollups)
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class SyncStateTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user("sync-state")
+        self.jira_entry = create_jira_entry(self.user, jira_entry_id="100", last_synced_at=timezone.now())
+
+    def test_queued_rows_count_as_unsynced(self):
+        self.assertFalse(JiraEntry.objects.unsynced().exists())
+
+        OutboxService.enqueue_sync(self.jira_entry)
+
+        self.assertIsNone(self.jira_entry.last_synced_at)
+        self.assertEqual(JiraEntry.objects.unsynced().get(), self.jira_entry)
+
+    def test_changed_form_clears_sync_state(self):
+        form = JiraEntryForm(data={
+            "entry": self.jira_entry.entry_id,
+            "jira_issue_number": self.jira_entry.jira_issue_number,
+            "minutes_spent": 90,
+            "description": self.jira_entry.description,
+        }, instance=self.jira_entry, user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.assertEqual(JiraEntry.objects.unsynced().get(), self.jira_entry)
+        self.assertEqual(SyncOutbox.objects.filter(object_id=self.jira_entry.pk, status=SyncOutbox.PENDING).count(), 1)
+
+    def test_successful_push_marks_the_row_synced(self):
+        message = OutboxService.enqueue_sync(self.jira_entry)
+
+        with mock.patch("api_clients.base.BaseApiClient.request", return_value=get_response(data={"id": "100"})):
+            OutboxService().process_batch()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, SyncOutbox.DONE)
+        self.assertFalse(JiraEntry.objects.unsynced().exists())
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class PayloadHashTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user("hashes")
+        self.jira_entry = create_jira_entry(self.user)
+        RiseEntry.objects.create(entry=self.jira_entry.entry, value="Day", hours_worked=8, rise_assignment_id="11")
+        self.rise_entry = RiseEntry.objects.select_related("entry__user").get()
+
+    @mock.patch("api_clients.base.BaseApiClient.request", return_value=get_response(data={"id": "100"}))
+    def test_jira_update_is_skipped_when_the_worklog_is_unchanged(self, request):
+        client = JiraApiClient(self.user)
+        client.create_entry(self.jira_entry)
+        client.update_entry(self.jira_entry)
+        self.assertEqual([call.args[0] for call in request.call_args_list], ["POST"])
+
+        self.jira_entry.minutes_spent = 45
+        client.update_entry(self.jira_entry)
+        self.assertEqual(request.call_count, 2)
+
+        # A row changed since the last push is always sent
+        self.jira_entry.last_synced_at = None
+        client.update_entry(self.jira_entry)
+        self.assertEqual(request.call_count, 3)
+
+    @mock.patch("api_clients.base.BaseApiClient.request", return_value=get_response(data={"id": "100"}))
+    def test_rise_update_is_skipped_when_the_timesheet_is_unchanged(self, request):
+        client = RiseApiClient(self.user)
+        client.create_entry(self.rise_entry)
+        client.update_entry(self.rise_entry)
+        self.assertEqual(request.call_count, 1)
+
+        self.rise_entry.hours_worked = 6
+        client.update_entry(self.rise_entry)
+        self.assertEqual(request.call_count, 2)
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class EntryChangeViewTests(TestCase):
+    dashboard = {"tables": {"global_projects": [], "assignments": [{
+        "id": 11, "start_date": "2020-01-01", "end_date": "2030-12-31",
+        "milestone": {"start_date": "2020-01-01", "end_date": "2030-12-31", "project": {"name": "Project"}},
+    }]}}
+
+    def setUp(self):
+        self.user = create_user("admin")
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create_entry(self, worklogs: int) -> Entry:
+        entry = Entry.objects.create(user=self.user, date_created=timezone.localdate() - timezone.timedelta(days=worklogs))
+        JiraEntry.objects.bulk_create([
+            JiraEntry(entry=entry, jira_issue_number=f"ABC-{number}", minutes_spent=30, description="Work",
+                      jira_entry_id=str(number))
+            for number in range(worklogs)
+        ])
+        RiseEntry.objects.create(entry=entry, value="Day", hours_worked=8, rise_entry_id="1", rise_assignment_id="11")
+        return entry
+
+    def get_form_data(self, entry: Entry) -> dict:
+        worklogs = list(entry.jiraentry_set.order_by("pk"))
+        data = {
+            "user": self.user.pk, "date_created": entry.date_created.isoformat(),
+            "jiraentry_set-TOTAL_FORMS": len(worklogs), "jiraentry_set-INITIAL_FORMS": len(worklogs),
+            "jiraentry_set-MIN_NUM_FORMS": 0, "jiraentry_set-MAX_NUM_FORMS": 1000,
+            "riseentry-TOTAL_FORMS": 1, "riseentry-INITIAL_FORMS": 1,
+            "riseentry-MIN_NUM_FORMS": 0, "riseentry-MAX_NUM_FORMS": 1,
+            "riseentry-0-id": entry.riseentry.pk, "riseentry-0-entry": entry.pk, "riseentry-0-value": "Day",
+            "riseentry-0-hours_worked": "8", "riseentry-0-rise_assignment_id": "11",
+        }
+        for index, jira_entry in enumerate(worklogs):
+            data.update({
+                f"jiraentry_set-{index}-id": jira_entry.pk, f"jiraentry_set-{index}-entry": entry.pk,
+                f"jiraentry_set-{index}-jira_issue_number": jira_entry.jira_issue_number,
+                f"jiraentry_set-{index}-minutes_spent": 30, f"jiraentry_set-{index}-description": "Work",
+            })
+        return data
+
+    def assertChangeViewQueries(self, worklogs: int, get_queries: int, post_queries: int):
+        entry = self.create_entry(worklogs)
+        url = reverse("admin:entries_entry_change", args=[entry.pk])
+        data = self.get_form_data(entry)
+        RiseApiClient.clear_cache(self.user)
+        ContentType.objects.clear_cache()
+
+        with mock.patch("api_clients.base.BaseApiClient.request", return_value=get_response(data=self.dashboard)):
+            with self.assertNumQueries(get_queries):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            with self.assertNumQueries(post_queries):
+                self.assertEqual(self.client.post(url, data).status_code, 302)
+
+    def test_query_count_does_not_grow_with_the_worklogs(self):
+        self.assertChangeViewQueries(1, get_queries=9, post_queries=13)
+        self.assertChangeViewQueries(30, get_queries=9, post_queries=13)
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class IntegrationCallLogAdminTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user("calls")
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        IntegrationCallLog.objects.bulk_create([
+            IntegrationCallLog(user=self.user, integration="jira", method="GET", endpoint=endpoint, status=status,
+                               duration_ms=duration)
+            for endpoint, status, duration in [
+                ("/rest/api/3/search/jql", 200, 120), ("/rest/api/3/search/jql", 429, 15),
+                ("/rest/api/3/issue/{key}/worklog", 503, 900), ("/rest/api/3/issue/{key}/worklog", None, 30000),
+            ]
+        ])
+
+    def get_durations(self, query: str = "") -> list:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("admin:entries_integrationcalllog_changelist") + query)
+        self.assertEqual(response.status_code, 200)
+        # The filter choices don't scan the log
+        self.assertFalse([query for query in context.captured_queries if "DISTINCT" in query["sql"]])
+        return [call.duration_ms for call in response.context["cl"].result_list]
+
+    def test_slowest_calls_first(self):
+        self.assertEqual(self.get_durations(), [30000, 900, 120, 15])
+
+    def test_endpoint_and_status_filters(self):
+        self.assertEqual(self.get_durations("?endpoint=/rest/api/3/search/jql"), [120, 15])
+        self.assertEqual(self.get_durations("?status_class=5xx"), [900])
+        self.assertEqual(self.get_durations("?status_class=429"), [15])
+        self.assertEqual(self.get_durations("?status_class=none"), [30000])
+
+
+@override_settings(ENCRYPTION_KEY=TEST_ENCRYPTION_KEY)
+class JiraIssueSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user("issues")
+        issue_cache.clear()
+        issue_search_cache.clear()
+
+    def test_search_follows_next_page_token(self):
+        responses = [
+            get_response(data={"issues": [{"id": "1", "key": "ABC-1"}], "nextPageToken": "next", "isLast": False}),
+            get_response(data={"issues": [{"id": "2", "key": "ABC-2"}], "isLast": True}),
+        ]
+        with mock.patch("api_clients.base.BaseApiClient.request", side_effect=responses) as request:
+            issue_keys = JiraApiClient(self.user).get_issue_keys(["1", "2"])
+
+        self.assertEqual(issue_keys, {"1": "ABC-1", "2": "ABC-2"})
+        self.assertEqual(request.call_args_list[1].kwargs["json"]["nextPageToken"], "next")
+        self.assertEqual(request.call_args_list[0].args[1], "https://jira.example.com/rest/api/3/search/jql")
+
+    def test_unknown_keys_are_dropped_from_the_search(self):
+        responses = [
+            get_response(400, {"errorMessages": ["An issue with key 'ABC-9' does not exist for field 'key'."]}),
+            get_response(data={"issues": [{"key": "ABC-1", "fields": {"summary": "Login"}}], "isLast": True}),
+        ]
+        with mock.patch("api_clients.base.BaseApiClient.request", side_effect=responses) as request:
+            issues = JiraApiClient(self.user).get_issues(["abc-1", "ABC-9", "not a key"])
+
+        self.assertEqual(issues, {"ABC-1": {"key": "ABC-1", "summary": "Login"}})
+        self.assertEqual(
+            [call.kwargs["json"]["jql"] for call in request.call_args_list],
+            ['key in ("ABC-1", "ABC-9")', 'key in ("ABC-1")'],
+        )
+
+        # Found issues are cached
+        with mock.patch("api_clients.base.BaseApiClient.request") as request:
+            JiraApiClient(self.user).get_issues(["ABC-1"])
+        request.assert_not_called()
+
+    def test_suggestions_fall_back_to_the_summary_for_unknown_keys(self):
+        responses = [
+            get_response(400, {"errorMessages": ["An issue with key 'ABC-9' does not exist for field 'key'."]}),
+            get_response(data={"issues": [{"key": "ABC-1", "fields": {"summary": "abc-9 follow-up"}}], "isLast": True}),
+        ]
+        with mock.patch("api_clients.base.BaseApiClient.request", side_effect=responses) as request:
+            suggestions = JiraApiClient(self.user).suggest_issues("abc-9")
+
+        self.assertEqual(suggestions, [{"key": "ABC-1", "summary": "abc-9 follow-up"}])
+        self.assertEqual(
+            [call.kwargs["json"]["jql"] for call in request.call_args_list],
+            ['key = "ABC-9" OR summary ~ "abc 9*" ORDER BY updated DESC', 'summary ~ "abc 9*" ORDER BY updated DESC'],
+        )
@@ -1,3 +1,12 @@
-from django.shortcuts import render
+from entries.services import DashboardService
 
-# Create your views here.
+
+def dashboard_callback(request, context):
+    dashboard_service = DashboardService(user=request.user)
+    context.update({
+        "hours": dashboard_service.get_hours(),
+        "unsynced": dashboard_service.get_unsynced_counts(),
+        "top_jira_issues": dashboard_service.get_top_jira_issues(),
+    })
+
+    return context
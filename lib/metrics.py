@@ -0,0 +1,133 @@
+"""
+Prometheus metrics for the admin views and the Jira/Rise integrations, served at /metrics.
+
+When the app runs with more than one worker process, set PROMETHEUS_MULTIPROC_DIR to an empty directory writable by
+all of them (and cleared on deploy). Every process then writes its samples there and /metrics aggregates them.
+"""
+import hmac
+import os
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, \
+    generate_latest, multiprocess
+
+# Name of the view serving the current request. Calls made outside a request (sync worker, commands) are "background"
+current_view = ContextVar("current_view", default="background")
+
+REQUEST_DURATION = Histogram(
+    "timetracker_request_duration_seconds",
+    "Time spent serving a request, by view",
+    ["view", "method", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "timetracker_request_db_queries",
+    "Database queries made while serving a request",
+    ["view"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 100, 200, 500, 1000),
+)
+REQUEST_DB_DURATION = Histogram(
+    "timetracker_request_db_duration_seconds",
+    "Time spent in database queries while serving a request",
+    ["view"],
+)
+OUTBOUND_REQUESTS = Counter(
+    "timetracker_outbound_requests_total",
+    "Calls made to the Jira and Rise APIs, by response status or 'error' when no response was received",
+    ["integration", "endpoint", "method", "status", "view"],
+)
+OUTBOUND_DURATION = Histogram(
+    "timetracker_outbound_request_duration_seconds",
+    "Time spent in calls to the Jira and Rise APIs, including rate limit waits and retries",
+    ["integration", "endpoint", "method", "view"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+CALL_LOG_DROPPED = Counter(
+    "timetracker_call_log_dropped_total",
+    "Integration call log records lost before reaching the database, because the buffer was full or the write failed",
+    ["reason"],
+)
+
+
+def record_outbound_call(integration: str, endpoint: str, method: str, status, duration: float) -> None:
+    """
+    Record one call made by an API client. endpoint is the path template (e.g. /rest/api/3/issue/{key}/worklog), never
+    the real URL, so the label values stay bounded.
+    """
+    view = current_view.get()
+    OUTBOUND_REQUESTS.labels(integration, endpoint, method, str(status), view).inc()
+    OUTBOUND_DURATION.labels(integration, endpoint, method, view).observe(duration)
+
+
+class QueryTimer:
+    """
+    Execute wrapper counting the queries run on a connection and the time spent in them.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records latency, query count and query time of every request, labelled with the URL name of the view that served
+    it (e.g. admin:entries_entry_change). Requests that don't resolve to a view are labelled "unresolved".
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        token = current_view.set("unresolved")
+        started = time.perf_counter()
+
+        try:
+            with connection.execute_wrapper(timer):
+                response = self.get_response(request)
+            status = response.status_code
+        except Exception:
+            status = 500
+            raise
+        finally:
+            view = current_view.get()
+            REQUEST_DURATION.labels(view, request.method, str(status)).observe(time.perf_counter() - started)
+            REQUEST_DB_QUERIES.labels(view).observe(timer.count)
+            REQUEST_DB_DURATION.labels(view).observe(timer.duration)
+            current_view.reset(token)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The view is only known once the URL resolved, after __call__ started
+        current_view.set(request.resolver_match.view_name)
+
+
+def metrics_view(request):
+    # Scrapers send "Authorization: Bearer <METRICS_TOKEN>", staff may also look while logged in. Everyone else,
+    # and every scraper while no token is configured, is turned away
+    has_token = bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+    )
+    if not (has_token or request.user.is_staff):
+        return HttpResponseForbidden()
+
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
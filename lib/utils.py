@@ -1,7 +1,15 @@
+import hashlib
+import json
+
 from cryptography.fernet import Fernet
 from django.conf import settings
 from django.utils import timezone
 
+from lib.cache import TTLCache
+
+# Decrypted API keys keyed by (user id, ciphertext), so a rotated key never hits a stale entry
+credential_cache = TTLCache(maxsize=settings.CREDENTIAL_CACHE_SIZE, ttl=settings.CREDENTIAL_CACHE_TTL)
+
 
 class FernetCipher:
     def __init__(self):
@@ -14,5 +22,24 @@ class FernetCipher:
         return self.cipher.decrypt(value.encode()).decode()
 
 
+def get_decrypted_credential(user_id: int, value: str) -> str:
+    cache_key = (user_id, value)
+    decrypted_value = credential_cache.get(cache_key)
+    if decrypted_value is None:
+        decrypted_value = FernetCipher().decrypt_value(value)
+        credential_cache.set(cache_key, decrypted_value)
+
+    return decrypted_value
+
+
+def clear_credential_cache(user_id: int) -> None:
+    credential_cache.discard_where(lambda key: key[0] == user_id)
+
+
 def format_date(date_str: str) -> str:
-    return timezone.datetime.strptime(date_str, "%Y-%m-%d").strftime("%d %b %Y")
\ No newline at end of file
+    return timezone.datetime.strptime(date_str, "%Y-%m-%d").strftime("%d %b %Y")
+
+
+def get_payload_hash(payload: dict) -> str:
+    # Stable fingerprint of a request body, independent of key order
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lib.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,7 +69,7 @@ ROOT_URLCONF = 'time_tracker.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -122,6 +123,8 @@ AUTH_PASSWORD_VALIDATORS = [
 
 # Encryption Settings
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY')
+CREDENTIAL_CACHE_TTL = int(os.getenv('CREDENTIAL_CACHE_TTL', 900))  # seconds
+CREDENTIAL_CACHE_SIZE = int(os.getenv('CREDENTIAL_CACHE_SIZE', 512))
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -150,8 +153,44 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# JIRA
+JIRA_ISSUE_CACHE_TTL = int(os.getenv('JIRA_ISSUE_CACHE_TTL', 3600))  # seconds
+JIRA_ISSUE_CACHE_SIZE = int(os.getenv('JIRA_ISSUE_CACHE_SIZE', 10000))
+JIRA_ISSUE_SEARCH_CACHE_TTL = int(os.getenv('JIRA_ISSUE_SEARCH_CACHE_TTL', 120))  # seconds
+JIRA_ISSUE_SEARCH_CACHE_SIZE = int(os.getenv('JIRA_ISSUE_SEARCH_CACHE_SIZE', 2000))
+
 # RISE
 RISE_API_URL = os.getenv('RISE_API_URL')
+RISE_DASHBOARD_CACHE_TTL = int(os.getenv('RISE_DASHBOARD_CACHE_TTL', 120))  # seconds
+RISE_DASHBOARD_CACHE_SIZE = int(os.getenv('RISE_DASHBOARD_CACHE_SIZE', 256))
+
+# Outbound integration HTTP settings
+INTEGRATION_CONNECT_TIMEOUT = float(os.getenv('INTEGRATION_CONNECT_TIMEOUT', 5))  # seconds
+INTEGRATION_READ_TIMEOUT = float(os.getenv('INTEGRATION_READ_TIMEOUT', 30))  # seconds
+INTEGRATION_POOL_MAXSIZE = int(os.getenv('INTEGRATION_POOL_MAXSIZE', 10))  # connections kept alive per host
+INTEGRATION_RATE_LIMIT = float(os.getenv('INTEGRATION_RATE_LIMIT', 5))  # requests per second per host and user
+INTEGRATION_RATE_BURST = float(os.getenv('INTEGRATION_RATE_BURST', 10))
+INTEGRATION_RATE_MAX_WAIT = float(os.getenv('INTEGRATION_RATE_MAX_WAIT', 60))  # seconds, longer waits raise RateLimited
+
+# Sync outbox
+SYNC_OUTBOX_MAX_ATTEMPTS = int(os.getenv('SYNC_OUTBOX_MAX_ATTEMPTS', 8))
+SYNC_OUTBOX_RETRY_BACKOFF = int(os.getenv('SYNC_OUTBOX_RETRY_BACKOFF', 30))  # seconds, doubled on every retry
+SYNC_OUTBOX_LEASE = int(os.getenv('SYNC_OUTBOX_LEASE', 300))  # seconds a claimed message is left to its worker
+SYNC_ON_SAVE = os.getenv('SYNC_ON_SAVE', 'True') == 'True'  # push admin saves right after commit, not only from the worker
+
+# Admin dashboard widgets
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', 60))  # seconds
+DASHBOARD_CACHE_SIZE = int(os.getenv('DASHBOARD_CACHE_SIZE', 1024))
+
+# Integration call log, written in batches by a background thread in every process
+CALL_LOG_ENABLED = os.getenv('CALL_LOG_ENABLED', 'True') == 'True'
+CALL_LOG_BATCH_SIZE = int(os.getenv('CALL_LOG_BATCH_SIZE', 200))
+CALL_LOG_FLUSH_INTERVAL = float(os.getenv('CALL_LOG_FLUSH_INTERVAL', 5))  # seconds
+CALL_LOG_MAX_BUFFER = int(os.getenv('CALL_LOG_MAX_BUFFER', 10000))  # records kept in memory when writes fall behind
+CALL_LOG_RETENTION_DAYS = int(os.getenv('CALL_LOG_RETENTION_DAYS', 14))
+
+# Prometheus metrics at /metrics, for scrapers sending "Authorization: Bearer <token>" and logged in staff only
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 
 try:
     from .unfold_settings import *
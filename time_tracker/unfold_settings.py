@@ -42,6 +42,7 @@ UNFOLD = {
             "950": "59 7 100",
         },
     },
+    "DASHBOARD_CALLBACK": "entries.views.dashboard_callback",
     "SIDEBAR": {
         "show_search": False,  # Search in applications and models names
         "show_all_applications": False,  # Dropdown with all applications and models
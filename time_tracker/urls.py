@@ -18,7 +18,10 @@ from django.contrib import admin
 from django.urls import path
 from django.views.generic import RedirectView
 
+from lib.metrics import metrics_view
+
 urlpatterns = [
     path('', RedirectView.as_view(url='/admin/', permanent=False), name='index'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
 ]
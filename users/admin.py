@@ -10,7 +10,8 @@ from unfold.widgets import UnfoldAdminPasswordInput
 from unfold.widgets import UnfoldAdminTextInputWidget
 
 
-from lib.utils import FernetCipher
+from api_clients.rise import RiseApiClient
+from lib.utils import FernetCipher, clear_credential_cache
 from users.models import User
 
 
@@ -69,6 +70,13 @@ class CustomUserChangeForm(UserChangeForm):
         # Update instance
         instance.save(update_fields=['rise_api_key', 'jira_api_key'])
 
+        # Drop anything cached with the old keys
+        if "rise_api_key" in self.changed_data or "jira_api_key" in self.changed_data:
+            clear_credential_cache(user_id=instance.pk)
+
+        if "rise_api_key" in self.changed_data:
+            RiseApiClient.clear_cache(user=instance)
+
         return instance
 
 
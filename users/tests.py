@@ -1,3 +1,47 @@
-from django.test import TestCase
+from cryptography.fernet import Fernet
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from lib.utils import FernetCipher, credential_cache, get_decrypted_credential
+from users.admin import CustomUserChangeForm
+from users.models import User
+
+
+@override_settings(ENCRYPTION_KEY=Fernet.generate_key().decode())
+class CustomUserChangeFormTests(TestCase):
+
+    def setUp(self):
+        cipher = FernetCipher()
+        self.user = User.objects.create_user(
+            username="keys", rise_api_key=cipher.encrypt_value("old rise"), jira_api_key=cipher.encrypt_value("old jira")
+        )
+        credential_cache.clear()
+
+    def get_form(self, **data) -> CustomUserChangeForm:
+        initial = {"username": self.user.username, "rise_api_key": self.user.rise_api_key,
+                   "jira_api_key": self.user.jira_api_key, "rise_user_id": ""}
+        return CustomUserChangeForm({**initial, **data}, instance=self.user)
+
+    def test_changed_keys_are_encrypted_and_uncached(self):
+        get_decrypted_credential(self.user.pk, self.user.jira_api_key)
+        get_decrypted_credential(self.user.pk, self.user.rise_api_key)
+
+        form = self.get_form(jira_api_key=" new jira ")
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(FernetCipher().decrypt_value(self.user.jira_api_key), "new jira")
+        self.assertEqual(FernetCipher().decrypt_value(self.user.rise_api_key), "old rise")
+        self.assertEqual(len(credential_cache), 0)
+
+    def test_unchanged_keys_are_kept(self):
+        rise_api_key = self.user.rise_api_key
+        get_decrypted_credential(self.user.pk, rise_api_key)
+
+        form = self.get_form()
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.rise_api_key, rise_api_key)
+        self.assertEqual(len(credential_cache), 1)